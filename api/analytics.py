@@ -0,0 +1,221 @@
+"""
+Sales rollups: quantity and revenue per (bucket, item, category, status).
+
+Hourly rows are recomputed from the order lines of that hour. Daily rows
+are recomputed from the day's hourly rows. Both replace whatever the
+bucket held, so recomputing a bucket any number of times gives the same
+result. Order.save and bulk status transitions queue a recompute of the
+order's hour; ``rebuild_sales_rollups`` catches up on anything else (old
+data, lines edited by hand). Reports read the rollups only, so their cost
+follows the number of buckets asked for, not the number of orders.
+
+Buckets start on the hour/day in the current time zone and are keyed by
+when the order was placed; a status change moves the order's lines
+between the status rows of that same bucket.
+
+A recompute deletes then inserts, so two jobs recomputing the same day at
+once would both insert. On Postgres each recompute first takes a
+transaction-level advisory lock per day and granularity, so they run one
+after the other; SQLite already lets only one transaction write at a time.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+HOUR = "hour"
+DAY = "day"
+GRANULARITIES = (HOUR, DAY)
+
+# Report range when none is given, and the longest range reported by the hour
+REPORT_DAYS = 30
+MAX_HOURLY_DAYS = 7
+
+# Seconds to wait before recomputing an hour, so a burst of orders in that
+# hour is rolled up by one job
+ROLLUP_DELAY = getattr(settings, "SALES_ROLLUP_DELAY", 60)
+
+
+def hour_of(moment):
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(day):
+    """The moment ``day`` (a date) starts in the current time zone."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# First key of the advisory locks taken per (granularity, day); the second is the day's ordinal
+ROLLUP_LOCK_KEYS = {HOUR: 0x5A1E0001, DAY: 0x5A1E0002}
+
+
+def _lock_days(granularity, days):
+    """Wait for other recomputes of ``days`` to commit (Postgres only)."""
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        # Sorted, so recomputes of overlapping ranges cannot deadlock
+        for day in sorted(days):
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [ROLLUP_LOCK_KEYS[granularity], day.toordinal()])
+
+
+def _insert(granularity, rows):
+    from .models import SalesRollup
+
+    SalesRollup.objects.bulk_create(
+        (
+            SalesRollup(
+                granularity=granularity,
+                bucket=row["bucket"],
+                item_id=row["item"],
+                item_name=row["name"],
+                category=row["category"],
+                status=row["status"],
+                lines=row["line_count"],
+                quantity=row["units"] or 0,
+                revenue=row["amount"] or 0,
+            )
+            for row in rows
+        ),
+        batch_size=1000,
+    )
+
+
+def _days(start, end):
+    """Dates of the local days that ``[start, end)`` touches."""
+    first = timezone.localtime(start).date()
+    last = timezone.localtime(end - timedelta(microseconds=1)).date()
+    return {first + timedelta(days=n) for n in range((last - first).days + 1)}
+
+
+def _rollup_hours(start, end):
+    from .models import ItemPurchase, SalesRollup
+
+    rows = (
+        ItemPurchase.objects.filter(order__order_at__gte=start, order__order_at__lt=end)
+        .annotate(bucket=TruncHour("order__order_at"), category=F("item_category"), status=F("order__status"))
+        .values("bucket", "item", "category", "status")
+        .annotate(name=Max("item_name"), line_count=Count("id"), units=Sum("quantity"), amount=Sum("total_price"))
+        .order_by()
+    )
+    with transaction.atomic():
+        _lock_days(HOUR, _days(start, end))
+        SalesRollup.objects.filter(granularity=HOUR, bucket__gte=start, bucket__lt=end).delete()
+        _insert(HOUR, rows)
+
+
+def refresh_days(days):
+    """Recompute the daily rows of ``days`` (dates) from their hourly rows."""
+    from .models import SalesRollup
+
+    for day in sorted(days):
+        start, end = day_start(day), day_start(day + timedelta(days=1))
+        rows = (
+            SalesRollup.objects.filter(granularity=HOUR, bucket__gte=start, bucket__lt=end)
+            .values("item", "category", "status")
+            .annotate(name=Max("item_name"), line_count=Sum("lines"), units=Sum("quantity"), amount=Sum("revenue"))
+            .order_by()
+        )
+        with transaction.atomic():
+            _lock_days(DAY, [day])
+            SalesRollup.objects.filter(granularity=DAY, bucket=start).delete()
+            _insert(DAY, ({**row, "bucket": start} for row in rows))
+
+
+def refresh_range(start, end):
+    """Recompute the hourly rows in ``[start, end)`` and the days they touch."""
+    _rollup_hours(start, end)
+    refresh_days(_days(start, end))
+
+
+def refresh_hours(hours):
+    """Recompute each hour in ``hours`` (bucket starts) and the days they fall in."""
+    hours = sorted(set(hours))
+    for hour in hours:
+        _rollup_hours(hour, hour + timedelta(hours=1))
+    refresh_days({timezone.localtime(hour).date() for hour in hours})
+
+
+def rebuild_sales_rollups(since=None, until=None, missing=False):
+    """
+    Recompute every day from ``since`` to ``until`` (dates, inclusive), one
+    day at a time. Defaults to the first order's day through today.
+    ``missing`` skips days that already have daily rows, so a deploy only
+    pays for history the jobs never rolled up. Returns the number of days
+    recomputed.
+    """
+    from .models import Order, SalesRollup
+
+    if since is None:
+        first = Order.objects.filter(order_at__isnull=False).order_by("order_at").values_list("order_at", flat=True).first()
+        if first is None:
+            return 0
+        since = timezone.localtime(first).date()
+    until = until or timezone.localdate()
+    done = set()
+    if missing:
+        buckets = SalesRollup.objects.filter(
+            granularity=DAY, bucket__gte=day_start(since), bucket__lt=day_start(until + timedelta(days=1))
+        ).values_list("bucket", flat=True).distinct()
+        done = {timezone.localtime(bucket).date() for bucket in buckets}
+    days = 0
+    for offset in range((until - since).days + 1):
+        day = since + timedelta(days=offset)
+        if day in done:
+            continue
+        refresh_range(day_start(day), day_start(day + timedelta(days=1)))
+        days += 1
+    return days
+
+
+def sales_report(start, end, granularity=DAY, statuses=None, top=10):
+    """
+    Totals, a per-bucket series, a per-category breakdown and the ``top``
+    items by revenue for buckets in ``[start, end)``, read from the rollups.
+
+    ``statuses`` limits the orders counted; by default canceled orders are
+    left out. Two grouped scans of the rollups answer everything: one by
+    bucket and one by (item, category), whose few hundred rows give the
+    categories and top items.
+    """
+    from .models import SalesRollup
+
+    rows = SalesRollup.objects.filter(granularity=granularity, bucket__gte=start, bucket__lt=end)
+    rows = rows.filter(status__in=statuses) if statuses else rows.exclude(status="Canceled")
+    totals = {"units": Sum("quantity"), "amount": Sum("revenue")}
+
+    series = [
+        {"bucket": row["bucket"], "quantity": row["units"], "revenue": row["amount"]}
+        for row in rows.values("bucket").annotate(**totals).order_by("bucket")
+    ]
+    items = list(rows.values("item", "category").annotate(name=Max("item_name"), **totals).order_by())
+
+    categories = defaultdict(lambda: {"quantity": 0, "revenue": Decimal("0")})
+    top_items = defaultdict(lambda: {"name": None, "quantity": 0, "revenue": Decimal("0")})
+    for row in items:
+        for entry in (categories[row["category"]], top_items[row["item"]]):
+            entry["quantity"] += row["units"]
+            entry["revenue"] += row["amount"]
+        top_items[row["item"]]["name"] = top_items[row["item"]]["name"] or row["name"]
+
+    return {
+        "start": start,
+        "end": end,
+        "granularity": granularity,
+        "quantity": sum(row["quantity"] for row in series),
+        "revenue": sum((row["revenue"] for row in series), Decimal("0")),
+        "series": series,
+        "categories": sorted(
+            ({"category": category, **entry} for category, entry in categories.items()),
+            key=lambda row: (-row["revenue"], row["category"] or ""),
+        ),
+        "top_items": sorted(
+            ({"item": item, **entry} for item, entry in top_items.items()),
+            key=lambda row: (-row["revenue"], row["item"] is None, row["item"] or 0),
+        )[:top],
+    }
@@ -0,0 +1,158 @@
+"""
+ASGI-native versions of the read-heavy catalog and dashboard endpoints.
+
+A part of a response that is a plain query uses the async ORM (aget,
+acount, async for). Parts that serialize model instances can't: DRF
+serializers are synchronous and may query as they go. Those run with
+``thread_sensitive=False`` instead, each on its own worker thread and
+database connection. The async ORM funnels every query through one shared
+thread, so at most one async-ORM part per response overlaps with the
+threaded ones; putting two on it would run them back to back. Serve these
+views with an ASGI server, e.g. ``uvicorn server.asgi:application``.
+
+``order_events`` is a Server-Sent Events stream of order changes
+(api.events); under ASGI an idle stream holds no thread. It only works
+under ASGI: a WSGI server reads a streaming body to the end before sending
+it, which for a stream that never ends means a worker lost for good, so
+there it answers 501. The Vercel deployment (vercel.json) is WSGI; run
+the events endpoint as a long-lived ASGI service next to it, e.g.
+``uvicorn server.asgi:application --workers 2`` behind the same domain,
+with the proxy sending ``/async/`` there and
+``ORDER_EVENTS_BACKEND=postgres`` so every worker hears every change.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authentication import CachedTokenAuthentication
+from .events import broker
+from .groups import user_groups
+from .pagination import cursor_headers, requested_fields
+from .payloads import ashop_categories, catalog_page, delivery_partners, latest_orders, new_arrivals, shop_payload
+from .serializers import ItemSerializer
+from .summary import order_summary
+
+
+def _in_own_thread(func, *args):
+    def run():
+        try:
+            return func(*args)
+        finally:
+            # Honour CONN_MAX_AGE for the worker thread's connection
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+async def gather(*calls):
+    """
+    Run ``(func, *args)`` calls concurrently, each on its own connection.
+    A coroutine (an async ORM part) is awaited alongside them as is.
+    """
+    return await asyncio.gather(
+        *(call if asyncio.iscoroutine(call) else _in_own_thread(*call) for call in calls)
+    )
+
+
+def _json(data, status=200, headers=None):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False, headers=headers)
+
+
+@require_GET
+async def shop(request):
+    try:
+        fields = requested_fields(request, ItemSerializer.Meta.fields)
+        categories, new_arrival, (page, next_cursor) = await gather(
+            ashop_categories(), (new_arrivals, fields), (catalog_page, request, fields)
+        )
+    except ValidationError as error:
+        return _json(error.detail, status=400)
+    payload = await sync_to_async(shop_payload)(categories, new_arrival, page, fields)
+    return _json(payload, headers=cursor_headers(next_cursor))
+
+
+@require_GET
+async def orders_overview(request):
+    summary, last_8_orders, partners = await gather(
+        (order_summary,), (latest_orders, 8), (delivery_partners,)
+    )
+    return _json({
+        "status_counts": summary["status_counts"],
+        "last_8_orders": last_8_orders,
+        "delivary_user": partners,
+    })
+
+
+@require_GET
+async def dashboard(request):
+    summary, last_6_orders = await gather((order_summary,), (latest_orders, 6))
+    return _json({
+        "total_amount": summary["total_revenue"],
+        "last_6_orders_data": last_6_orders,
+    })
+
+
+# Seconds between keep-alive comments, so proxies don't close an idle stream
+EVENTS_HEARTBEAT = 15
+EVENTS_RETRY_MS = 3000
+
+
+def _event_filter(request):
+    """
+    Authenticate the stream and return which order events it may see.
+
+    EventSource can't send headers, so the token may also come as ``?token=``.
+    Admins see every order, delivery partners only the ones assigned to them.
+    Returns a JSON error response instead when access is denied.
+    """
+    header = request.headers.get("Authorization", "")
+    key = header[len("Token "):] if header.startswith("Token ") else request.GET.get("token")
+    if not key:
+        return _json({"detail": "Authentication credentials were not provided."}, status=401)
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    except AuthenticationFailed as error:
+        return _json({"detail": str(error.detail)}, status=401)
+
+    names = {name for _, name in user_groups(user)}
+    if user.is_staff or user.is_superuser or "admin" in names:
+        return lambda event: True
+    if "delivary_partner" in names:
+        return lambda event: event["delivery_person"] == user.pk
+    return _json({"detail": "You do not have permission to perform this action."}, status=403)
+
+
+async def event_stream(subscription):
+    """Server-Sent Events frames for every event ``subscription`` receives."""
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: order\ndata: {json.dumps(event)}\n\n"
+    finally:
+        subscription.close()
+
+
+@require_GET
+async def order_events(request):
+    """Push order changes to admin and delivery dashboards instead of polling."""
+    if not isinstance(request, ASGIRequest):
+        return _json({"detail": "Order events are only served by the ASGI application."}, status=501)
+    allowed = await sync_to_async(_event_filter)(request)
+    if isinstance(allowed, JsonResponse):
+        return allowed
+    response = StreamingHttpResponse(event_stream(broker().subscribe(allowed)), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Don't let nginx buffer the stream
+    return response
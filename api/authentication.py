@@ -0,0 +1,133 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+DEFAULTS = {
+    "MAX_SIZE": 1024,  # Tokens kept per process
+    # Seconds a process trusts its own copy of a lookup. Invalidation only
+    # evicts it in the process that made the change, so this bounds how long
+    # other workers keep accepting a deleted token or a deactivated user.
+    "LOCAL_TTL": 5,
+    "TTL": 300,  # Seconds the shared copy (USE_DJANGO_CACHE) lives; it is deleted on invalidation
+    "USE_DJANGO_CACHE": False,  # Also share lookups between workers through CACHES['default']
+}
+
+SHARED_KEY = "auth-token:{key}"
+
+
+def cache_settings():
+    return {**DEFAULTS, **getattr(settings, "TOKEN_AUTH_CACHE", {})}
+
+
+class TokenUserCache:
+    """Thread-safe LRU of token key -> (user, token) with a time-to-live."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        user, _ = value
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._user_keys.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def evict(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1][0].pk
+        keys = self._user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user_id]
+
+
+_options = cache_settings()
+token_cache = TokenUserCache(_options["MAX_SIZE"], _options["LOCAL_TTL"])
+
+
+def invalidate_token(key):
+    token_cache.evict(key)
+    if cache_settings()["USE_DJANGO_CACHE"]:
+        cache.delete(SHARED_KEY.format(key=key))
+
+
+def invalidate_user(user_id):
+    token_cache.evict_user(user_id)
+    if cache_settings()["USE_DJANGO_CACHE"]:
+        from rest_framework.authtoken.models import Token
+
+        for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+            cache.delete(SHARED_KEY.format(key=key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers token -> user lookups.
+
+    Hits skip the Token/CustomUser join entirely. Deleting the token or
+    saving the user drops the entry from this process and from the shared
+    cache at once; other processes drop their own copy within
+    ``LOCAL_TTL`` seconds, which is how long a revoked token may still be
+    accepted there. The shared copy (when enabled) spares those re-reads
+    the database, and expires after ``TTL``.
+    """
+
+    def authenticate_credentials(self, key):
+        value = token_cache.get(key)
+        if value is None:
+            options = cache_settings()
+            if options["USE_DJANGO_CACHE"]:
+                value = cache.get(SHARED_KEY.format(key=key))
+            if value is None:
+                value = super().authenticate_credentials(key)
+                if options["USE_DJANGO_CACHE"]:
+                    cache.set(SHARED_KEY.format(key=key), value, options["TTL"])
+            token_cache.set(key, value)
+
+        user, token = value
+        if not user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+        # Each request gets its own instances so views can't mutate the cached ones
+        return (copy.copy(user), copy.copy(token))
@@ -0,0 +1,84 @@
+"""Throughput of the sync DRF views against their ASGI counterparts."""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.test import AsyncClient, Client
+
+from api.benchmarks import percentile
+from api.models import CustomUser, Item, ItemPurchase, Order
+
+ROUTES = {
+    "shop": ("/shop/", "/async/shop/"),
+    "orders": ("/orders/", "/async/orders/"),
+    "dashboard": ("/dashboard/", "/async/dashboard/"),
+}
+
+
+def seed(items=500, orders=200, purchases_per_order=3):
+    Item.objects.bulk_create(
+        Item(name=f"Dish {i}", category=f"Category {i % 12}", selling_price=100 + i % 50)
+        for i in range(items)
+    )
+    customer = CustomUser.objects.create_user(email="bench@example.com", mobile_number="7000000000")
+    dishes = list(Item.objects.all()[:purchases_per_order])
+    for _ in range(orders):
+        order = Order.objects.create(user=customer, total_price=300)
+        ItemPurchase.objects.bulk_create(
+            ItemPurchase(user=customer, order=order, quantity=1, total_price=dish.selling_price).snapshot_item(dish)
+            for dish in dishes
+        )
+
+
+def _sync_get(url):
+    try:
+        started = time.perf_counter()
+        assert Client().get(url).status_code == 200
+        return time.perf_counter() - started
+    finally:
+        connections.close_all()
+
+
+def run_sync(url, requests, concurrency):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(_sync_get, [url] * requests))
+    return samples, time.perf_counter() - started
+
+
+async def _run_async(url, requests, concurrency):
+    client = AsyncClient()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def get():
+        async with limit:
+            started = time.perf_counter()
+            response = await client.get(url)
+            assert response.status_code == 200
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(get() for _ in range(requests)))
+    return samples, time.perf_counter() - started
+
+
+def run_async(url, requests, concurrency):
+    return asyncio.run(_run_async(url, requests, concurrency))
+
+
+def run(routes, requests=200, concurrency=8):
+    results = []
+    for name in routes:
+        sync_url, async_url = ROUTES[name]
+        for mode, url, runner in (("sync", sync_url, run_sync), ("async", async_url, run_async)):
+            runner(url, concurrency, concurrency)  # warm up caches and connections
+            samples, wall = runner(url, requests, concurrency)
+            results.append({
+                "route": name,
+                "mode": mode,
+                "rps": requests / wall,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+            })
+    return results
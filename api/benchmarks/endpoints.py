@@ -0,0 +1,214 @@
+"""
+Latency, queries and allocations of the API endpoints against a baseline.
+
+``seed`` builds a parameterized dataset, ``run`` drives the real URL routes
+from api/urls.py through the test client and ``compare`` checks the results
+against the stored ``baseline.json``. Query counts must never grow;
+allocations and (optionally) latency may grow by a tolerance. Query counts
+are compared even when the dataset differs from the baseline's, since they
+should not depend on the data volume at all.
+"""
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from api.analytics import rebuild_sales_rollups
+from api.benchmarks import percentile
+from api.cart import apply_cart_changes
+from api.catalog import bump_catalog_version
+from api.ids import next_order_code
+from api.models import CartItem, CustomUser, Item, ItemPurchase, Order
+from api.summary import rebuild_order_summary
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+DATASET = {"items": 300, "categories": 12, "users": 20, "orders": 200, "purchases_per_order": 3}
+
+# Requests per endpoint measured under tracemalloc for queries and allocations
+TRACED_REQUESTS = 5
+
+
+def seed(items, categories, users, orders, purchases_per_order):
+    """Fill the database; return the ids and tokens the scenarios need."""
+    Item.objects.bulk_create(
+        Item(
+            name=f"Dish {n}",
+            description=f"Bench dish number {n}",
+            category=f"Category {n % categories}",
+            mrp_price=120 + n % 50,
+            selling_price=100 + n % 50,
+        )
+        for n in range(items)
+    )
+    bump_catalog_version()
+    dishes = list(Item.objects.order_by("id"))
+
+    # Passwords are never checked: every client authenticates with a token
+    CustomUser.objects.bulk_create(
+        CustomUser(email=f"bench{n}@example.com", mobile_number=f"7{n:09d}", password="!")
+        for n in range(users)
+    )
+    customers = list(CustomUser.objects.filter(email__startswith="bench").order_by("id"))
+    admin = CustomUser.objects.create(email="bench-admin@example.com", mobile_number="6000000000",
+                                      password="!", is_staff=True)
+
+    def basket(n):
+        return [dishes[(n + offset) % len(dishes)] for offset in range(purchases_per_order)]
+
+    Order.objects.bulk_create(
+        Order(user=customers[n % users], total_price=sum(dish.selling_price for dish in basket(n)),
+              unique_id=next_order_code())
+        for n in range(orders)
+    )
+    ItemPurchase.objects.bulk_create(
+        ItemPurchase(user_id=order.user_id, order=order, quantity=1, total_price=dish.selling_price).snapshot_item(dish)
+        for n, order in enumerate(Order.objects.order_by("id"))
+        for dish in basket(n)
+    )
+    rebuild_order_summary()
+    rebuild_sales_rollups()
+
+    return {
+        "tokens": {
+            "customer": Token.objects.create(user=customers[0]).key,
+            "admin": Token.objects.create(user=admin).key,
+        },
+        "customer": customers[0],
+        "category": dishes[0].category,
+        "item": dishes[0].id,
+        "dishes": [dish.id for dish in dishes[:5]],
+    }
+
+
+def fill_cart(context):
+    """Put a few dishes in the customer's cart so checkout has something to buy."""
+    apply_cart_changes(context["customer"], [{"dish": dish, "quantity": 1} for dish in context["dishes"]])
+    context["cart_lines"] = [
+        {"id": cart_id, "quantity": 1}
+        for cart_id in CartItem.objects.filter(user=context["customer"]).values_list("id", flat=True)
+    ]
+
+
+# name -> how to call it; "auth" picks the token, "prepare" runs unmeasured before each call
+SCENARIOS = {
+    "menu": {"route": "dishes"},
+    "shop": {"route": "shop"},
+    "new_dishes": {"route": "new_dishes"},
+    "category": {"route": "category_dishes", "args": lambda context: [context["category"]]},
+    "product": {"route": "product-details", "args": lambda context: [context["item"]]},
+    "search": {"route": "search", "query": {"q": "dish 1", "available": "true"}},
+    "cart": {"route": "cart", "auth": "customer"},
+    "cart_batch": {
+        "route": "cart-batch", "method": "post", "auth": "customer",
+        "body": lambda context: {"items": [{"dish": dish, "quantity": 2} for dish in context["dishes"]]},
+    },
+    "checkout": {
+        "route": "purchase-cart-items", "method": "post", "auth": "customer", "status": 201,
+        "prepare": fill_cart, "body": lambda context: {"cart_items": context["cart_lines"]},
+    },
+    "user_orders": {"route": "user-orders", "auth": "customer"},
+    "orders": {"route": "orders", "auth": "admin"},
+    "payments": {"route": "payments", "auth": "admin"},
+    "dashboard": {"route": "dashboard", "auth": "admin"},
+    "sales": {"route": "sales-report", "auth": "admin"},
+}
+
+
+def _call(client, scenario, context):
+    url = reverse(scenario["route"], args=scenario.get("args", lambda context: [])(context))
+    if "query" in scenario:
+        url += "?" + urlencode(scenario["query"])
+    headers = {}
+    if "auth" in scenario:
+        headers["HTTP_AUTHORIZATION"] = f"Token {context['tokens'][scenario['auth']]}"
+    if scenario.get("method", "get") == "post":
+        response = client.post(url, scenario["body"](context), content_type="application/json", **headers)
+    else:
+        response = client.get(url, **headers)
+    if response.status_code != scenario.get("status", 200):
+        raise RuntimeError(f"{url} answered {response.status_code}: {response.content[:200]!r}")
+    return response
+
+
+def measure(scenario, context, requests, warmup):
+    client = Client()
+    prepare = scenario.get("prepare", lambda context: None)
+
+    for _ in range(warmup):
+        prepare(context)
+        _call(client, scenario, context)
+
+    latencies = []
+    for _ in range(requests):
+        prepare(context)
+        started = time.perf_counter()
+        _call(client, scenario, context)
+        latencies.append(time.perf_counter() - started)
+
+    # Tracing slows everything down, so queries and allocations get their own pass
+    queries, allocations = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(min(requests, TRACED_REQUESTS)):
+            prepare(context)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            with CaptureQueriesContext(connection) as captured:
+                _call(client, scenario, context)
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+            queries.append(len(captured))
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        # Periodic work (summary cache refills, id block reservations) can add
+        # a query to one request; the median is the steady state
+        "queries": int(statistics.median(queries)),
+        "alloc_kib": round(statistics.median(allocations) / 1024, 1),
+    }
+
+
+def run(names, context, requests=50, warmup=5):
+    return {name: measure(SCENARIOS[name], context, requests, warmup) for name in names}
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(results, dataset, path=BASELINE_PATH):
+    with open(path, "w") as baseline:
+        json.dump({"dataset": dataset, "endpoints": results}, baseline, indent=2, sort_keys=True)
+        baseline.write("\n")
+
+
+def compare(results, baseline, dataset, alloc_tolerance=0.5, latency_tolerance=None):
+    """Return a description of every regression against ``baseline``."""
+    same_dataset = baseline["dataset"] == dataset
+    regressions = []
+    for name, row in results.items():
+        expected = baseline["endpoints"].get(name)
+        if expected is None:
+            continue
+        if row["queries"] > expected["queries"]:
+            regressions.append(f"{name}: {row['queries']} queries, baseline {expected['queries']}")
+        if not same_dataset:
+            continue
+        if row["alloc_kib"] > expected["alloc_kib"] * (1 + alloc_tolerance):
+            regressions.append(f"{name}: allocates {row['alloc_kib']} KiB, baseline {expected['alloc_kib']} KiB")
+        if latency_tolerance is not None and row["p95_ms"] > expected["p95_ms"] * (1 + latency_tolerance):
+            regressions.append(f"{name}: p95 {row['p95_ms']} ms, baseline {expected['p95_ms']} ms")
+    return regressions
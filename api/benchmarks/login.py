@@ -0,0 +1,69 @@
+"""Login latency under concurrent load for each password-hasher profile."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api.benchmarks import percentile
+from api.models import CustomUser
+
+PASSWORD = "bench-password"
+
+
+def seed_users(count):
+    # Hash once and reuse it; hashing per user would dominate setup time
+    template = CustomUser(email="template@example.com")
+    template.set_password(PASSWORD)
+    CustomUser.objects.bulk_create(
+        CustomUser(email=f"bench{i}@example.com", mobile_number=f"8{i:09d}", password=template.password)
+        for i in range(count)
+    )
+
+
+def _login(mobile_number):
+    try:
+        client = Client()
+        started = time.perf_counter()
+        response = client.post("/login/", {"mobile_number": mobile_number, "password": PASSWORD})
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.content
+        return elapsed
+    finally:
+        connections.close_all()
+
+
+def storm(users, logins, concurrency):
+    """Fire ``logins`` logins from ``concurrency`` threads; return (latencies, wall time)."""
+    numbers = [f"8{i % users:09d}" for i in range(logins)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(_login, numbers))
+    return samples, time.perf_counter() - started
+
+
+def queries_per_login():
+    client = Client()
+    client.post("/login/", {"mobile_number": "8000000000", "password": PASSWORD})
+    with CaptureQueriesContext(connection) as queries:
+        client.post("/login/", {"mobile_number": "8000000000", "password": PASSWORD})
+    return len(queries)
+
+
+def run(profiles, users=20, logins=200, concurrency=8):
+    results = []
+    for profile in profiles:
+        with override_settings(PASSWORD_HASHERS=settings.PASSWORD_HASHER_PROFILES[profile]):
+            CustomUser.objects.all().delete()
+            seed_users(users)
+            samples, wall = storm(users, logins, concurrency)
+            results.append({
+                "profile": profile,
+                "queries": queries_per_login(),
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+                "throughput": logins / wall,
+            })
+    return results
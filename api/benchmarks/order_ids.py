@@ -0,0 +1,77 @@
+"""
+Compare random order codes against the sequence allocator at various fill levels.
+
+The simulation runs on a short code length so every fill level fits in
+memory; the retry rate depends only on the fill ratio, not on the size of
+the code space.
+"""
+import random
+import statistics
+
+from api.ids import code_space, encode
+
+FILL_LEVELS = (0.1, 0.5, 0.75, 0.9, 0.99)
+
+
+def random_code(length):
+    return encode(random.randrange(code_space(length)), length)
+
+
+def simulate_random(fill, length, samples):
+    """Attempts per order for the old generate-then-check loop."""
+    space = code_space(length)
+    taken = set()
+    while len(taken) < int(space * fill):
+        taken.add(random_code(length))
+
+    attempts = []
+    for _ in range(samples):
+        tries = 1
+        code = random_code(length)
+        while code in taken:
+            tries += 1
+            code = random_code(length)
+        attempts.append(tries)
+    return attempts
+
+
+def simulate_allocator(fill, length, samples, legacy):
+    """INSERT attempts per order when codes come from the sequence."""
+    space = code_space(length)
+    used = int(space * fill)
+    # Orders placed before the allocator hold random codes
+    taken = {random_code(length) for _ in range(legacy)}
+    taken.update(encode(value, length) for value in range(used))
+
+    attempts = []
+    value = used
+    for _ in range(min(samples, space - len(taken))):
+        tries = 1
+        while encode(value, length) in taken:
+            tries += 1
+            value += 1
+        taken.add(encode(value, length))
+        value += 1
+        attempts.append(tries)
+    return attempts
+
+
+def summarize(attempts):
+    return {
+        "mean": statistics.fmean(attempts),
+        "p99": sorted(attempts)[int(len(attempts) * 0.99) - 1],
+        "max": max(attempts),
+    }
+
+
+def run(length=3, samples=2000, legacy=50, seed=0):
+    random.seed(seed)
+    results = []
+    for fill in FILL_LEVELS:
+        results.append({
+            "fill": fill,
+            # The old loop runs one exists() query per try before its INSERT
+            "random": summarize(simulate_random(fill, length, samples)),
+            "allocator": summarize(simulate_allocator(fill, length, samples, legacy)),
+        })
+    return results
@@ -0,0 +1,47 @@
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import CartItem, Item
+
+
+def cart_for(user):
+    """The user's cart rows with their dishes, in one query."""
+    return CartItem.objects.filter(user=user).select_related("dish").order_by("id")
+
+
+def apply_cart_changes(user, lines):
+    """
+    Set the quantity of several dishes in the user's cart at once.
+
+    ``lines`` is a list of ``{"dish": item_id, "quantity": n}``; ``n`` is the
+    new quantity and 0 removes the dish. Prices are read in one query, every
+    remaining line is written with a single INSERT ... ON CONFLICT upsert on
+    the unique (user, dish) pair and the removals with one DELETE, so
+    concurrent taps on the same dish can never create a second row.
+    """
+    quantities = {}
+    for line in lines:
+        quantities[line["dish"]] = line["quantity"]
+
+    prices = dict(Item.objects.filter(id__in=quantities).values_list("id", "selling_price"))
+    missing = sorted(dish_id for dish_id in quantities if prices.get(dish_id) is None)
+    if missing:
+        raise ValidationError(f"Dishes not available: {', '.join(map(str, missing))}.")
+
+    rows = [
+        CartItem(user=user, dish_id=dish_id, quantity=quantity, total_price=prices[dish_id] * quantity)
+        for dish_id, quantity in quantities.items()
+        if quantity
+    ]
+    removed = [dish_id for dish_id, quantity in quantities.items() if not quantity]
+
+    with transaction.atomic():
+        if rows:
+            CartItem.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["user", "dish"],
+                update_fields=["quantity", "total_price"],
+            )
+        if removed:
+            CartItem.objects.filter(user=user, dish_id__in=removed).delete()
@@ -0,0 +1,112 @@
+import datetime
+import hashlib
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .routers import primary_reads
+
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_LAST_MODIFIED_KEY = "catalog:last-modified"
+MENU_CACHE_KEY = "catalog:menu:v{version}"
+MENU_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def catalog_version():
+    """Return the current catalog version, seeding it if the cache lost it."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a cold cache never hands out a version
+        # that was already used before the eviction.
+        version = int(time.time() * 1000)
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog payload by moving to a new version."""
+    # HTTP dates have whole seconds, so a second bump within the same second
+    # still has to move Last-Modified forward for If-Modified-Since to miss
+    modified = int(time.time())
+    previous = cache.get(CATALOG_LAST_MODIFIED_KEY)
+    if previous is not None:
+        modified = max(int(previous) + 1, modified)
+    cache.set(CATALOG_LAST_MODIFIED_KEY, modified, timeout=None)
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        catalog_version()
+        return cache.incr(CATALOG_VERSION_KEY)
+
+
+def catalog_last_modified():
+    """When the catalog last changed, to the second (as HTTP dates are)."""
+    timestamp = cache.get(CATALOG_LAST_MODIFIED_KEY)
+    if timestamp is None:
+        timestamp = int(time.time())
+        if not cache.add(CATALOG_LAST_MODIFIED_KEY, timestamp, timeout=None):
+            timestamp = cache.get(CATALOG_LAST_MODIFIED_KEY, timestamp)
+    return datetime.datetime.fromtimestamp(int(timestamp), tz=datetime.timezone.utc)
+
+
+def catalog_etag(request, *args, **kwargs):
+    """Strong ETag for one catalog representation: version plus full path."""
+    representation = hashlib.sha1(request.get_full_path().encode()).hexdigest()[:16]
+    return f"{catalog_version()}-{representation}"
+
+
+def _catalog_cache_control(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            patch_cache_control(response, **settings.CATALOG_CACHE_CONTROL)
+        return response
+    return wrapper
+
+
+# Decorates a catalog APIView handler: answers If-None-Match/If-Modified-Since
+# with 304 from the cached catalog version alone, before the view runs any
+# query, and marks fresh responses cacheable for browsers and the CDN.
+catalog_conditional = method_decorator([
+    _catalog_cache_control,
+    condition(
+        etag_func=catalog_etag,
+        last_modified_func=lambda request, *args, **kwargs: catalog_last_modified(),
+    ),
+])
+
+
+def build_menu():
+    """Load the whole catalog in one query and group it by category."""
+    from .models import Item
+    from .serializers import ItemSerializer
+
+    items = Item.objects.exclude(category__isnull=True).exclude(category="").order_by("id")
+    grouped = OrderedDict()
+    for data in ItemSerializer(items, many=True).data:
+        grouped.setdefault(data["category"], []).append(data)
+
+    categories = {
+        category: {"items": rows, "count": len(rows)}
+        for category, rows in grouped.items()
+    }
+    return {"categories": categories, "category_count": len(categories)}
+
+
+def get_menu():
+    """Return the serialized menu, rebuilding it only when the catalog changed."""
+    key = MENU_CACHE_KEY.format(version=catalog_version())
+    menu = cache.get(key)
+    if menu is None:
+        with primary_reads():
+            menu = build_menu()
+        cache.set(key, menu, MENU_CACHE_TIMEOUT)
+    return menu
@@ -0,0 +1,83 @@
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import CartItem, ItemPurchase, Order
+
+
+def checkout(user, lines):
+    """
+    Turn the user's cart rows into one order.
+
+    ``lines`` is a list of ``{"id": cart_item_id, "quantity": n}``. The cart
+    rows and their dishes are read in one query, the purchases (each with a
+    snapshot of its dish) are written with one bulk INSERT and the cart rows
+    removed with one DELETE. Everything
+    runs in a single transaction, so a bad line leaves nothing behind.
+    """
+    quantities = {}
+    for line in lines:
+        quantities[line["id"]] = line["quantity"]
+
+    with transaction.atomic():
+        cart_items = {
+            cart_item.id: cart_item
+            for cart_item in CartItem.objects.select_for_update(of=("self",))
+            .select_related("dish")
+            .filter(id__in=quantities, user=user)
+        }
+
+        purchases = []
+        total_price = 0
+        for cart_item_id, quantity in quantities.items():
+            cart_item = cart_items.get(cart_item_id)
+            if cart_item is None or cart_item.dish is None:
+                raise ValidationError(
+                    f"Cart item with ID {cart_item_id} not found or doesn't belong to the user."
+                )
+            if cart_item.dish.selling_price is None:
+                raise ValidationError(f"{cart_item.dish.name} is not available for purchase.")
+
+            line_total = cart_item.dish.selling_price * quantity
+            total_price += line_total
+            purchases.append(
+                ItemPurchase(user=user, quantity=quantity, total_price=line_total).snapshot_item(cart_item.dish)
+            )
+
+        order = Order(user=user, total_price=total_price)
+        order.save()
+        for purchase in purchases:
+            purchase.order = order
+        ItemPurchase.objects.bulk_create(purchases)
+
+        CartItem.objects.filter(id__in=cart_items).delete()
+
+    return order
+
+
+SNAPSHOT_FIELDS = ["item_name", "item_category", "item_image", "item_rating", "unit_price"]
+
+
+def backfill_purchase_snapshots(batch_size=1000):
+    """
+    Fill the item snapshot of purchases made before lines carried one.
+
+    Works through the purchases in primary-key batches, each one SELECT
+    and one bulk UPDATE in its own transaction, so it can be stopped and
+    rerun at any point. The unit price is what the customer paid, not the
+    dish's current price. Returns the number of purchases updated.
+    """
+    pending = ItemPurchase.objects.filter(unit_price__isnull=True, item__isnull=False).select_related("item")
+    updated = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(pending.filter(pk__gt=last_pk).order_by("pk")[:batch_size])
+            if not batch:
+                return updated
+            for purchase in batch:
+                purchase.snapshot_item(purchase.item)
+                if purchase.total_price is not None and purchase.quantity:
+                    purchase.unit_price = purchase.total_price / purchase.quantity
+            ItemPurchase.objects.bulk_update(batch, SNAPSHOT_FIELDS)
+        updated += len(batch)
+        last_pk = batch[-1].pk
@@ -0,0 +1,153 @@
+"""
+Delivery partner roster, per-courier load and automatic assignment.
+
+Couriers are the members of the ``delivary_partner`` group, resolved by
+name. Each courier has a CourierLoad row counting the Shipped orders it is
+carrying. Order.save moves that count as orders are shipped, delivered,
+canceled or reassigned, and group membership changes add or remove rows.
+Picking the least-loaded courier is then the first entry of the
+``(active_orders, courier)`` index, however many couriers and open orders
+there are.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from rest_framework.exceptions import ValidationError
+
+COURIER_GROUP = "delivary_partner"
+ACTIVE_STATUS = "Shipped"
+
+ROSTER_KEY = "dispatch:roster"
+ROSTER_TIMEOUT = 60 * 60
+
+
+def couriers():
+    from .models import CustomUser
+
+    return CustomUser.objects.filter(groups__name=COURIER_GROUP)
+
+
+def courier_roster():
+    """Serialized couriers for the admin order screens, cached until the roster changes."""
+    from .serializers import UserSerializer
+
+    roster = cache.get(ROSTER_KEY)
+    if roster is None:
+        members = list(couriers().order_by("id").prefetch_related("groups"))
+        roster = {"ids": [user.pk for user in members], "data": UserSerializer(members, many=True).data}
+        cache.set(ROSTER_KEY, roster, ROSTER_TIMEOUT)
+    return roster["data"]
+
+
+def forget_roster():
+    cache.delete(ROSTER_KEY)
+
+
+def forget_courier(user_id):
+    """Drop the cached roster if ``user_id`` is on it, e.g. after their profile changed."""
+    roster = cache.get(ROSTER_KEY)
+    if roster is not None and user_id in roster["ids"]:
+        forget_roster()
+
+
+def _active_courier(state):
+    """The courier an order state keeps busy, if any."""
+    if state is None:
+        return None
+    order_status, _, courier_id = state
+    return courier_id if order_status == ACTIVE_STATUS else None
+
+
+def record_courier_change(previous, current):
+    """
+    Move one order between courier loads.
+
+    ``previous`` and ``current`` are ``Order.tracked_state()`` tuples, or
+    None when the order is being created or deleted. Call inside the
+    transaction that writes the order.
+    """
+    record_courier_changes([(previous, current)])
+
+
+def record_courier_changes(changes):
+    """Apply many ``(previous, current)`` pairs with one UPDATE per courier."""
+    from .models import CourierLoad
+
+    deltas = Counter()
+    for previous, current in changes:
+        before, after = _active_courier(previous), _active_courier(current)
+        if before != after:
+            if before is not None:
+                deltas[before] -= 1
+            if after is not None:
+                deltas[after] += 1
+    for courier_id, delta in deltas.items():
+        if delta:
+            CourierLoad.objects.filter(courier_id=courier_id).update(
+                active_orders=Greatest(F("active_orders") + delta, Value(0))
+            )
+
+
+def sync_couriers(user_ids=None):
+    """
+    Give every courier (among ``user_ids``, or everyone) a load row and drop
+    the rows of users who are no longer couriers.
+    """
+    from .models import CourierLoad, Order
+
+    members = couriers()
+    loads = CourierLoad.objects.all()
+    if user_ids is not None:
+        members = members.filter(pk__in=user_ids)
+        loads = loads.filter(courier_id__in=user_ids)
+
+    courier_ids = set(members.values_list("pk", flat=True))
+    loads.exclude(courier_id__in=courier_ids).delete()
+    missing = courier_ids - set(loads.values_list("courier_id", flat=True))
+    if missing:
+        active = dict(
+            Order.objects.filter(status=ACTIVE_STATUS, delivery_person__in=missing)
+            .values_list("delivery_person")
+            .annotate(count=Count("id"))
+        )
+        CourierLoad.objects.bulk_create(
+            [CourierLoad(courier_id=courier_id, active_orders=active.get(courier_id, 0)) for courier_id in missing],
+            ignore_conflicts=True,
+        )
+    forget_roster()
+
+
+def rebuild_courier_loads():
+    """Recount every courier's load from the orders table."""
+    from .models import CourierLoad
+
+    with transaction.atomic():
+        CourierLoad.objects.all().delete()
+        sync_couriers()
+    return CourierLoad.objects.count()
+
+
+def assign_courier(order_id):
+    """Ship a pending order with the least-loaded active courier and return it."""
+    from .models import CourierLoad, Order
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.status != "Pending":
+            raise ValidationError(f"Order {order.unique_id} is {order.status}; only pending orders can be assigned.")
+        # Concurrent assignments skip each other's locked rows and so spread
+        # over different couriers instead of queueing behind one
+        load = (
+            CourierLoad.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(courier__is_active=True)
+            .order_by("active_orders", "courier")
+            .first()
+        )
+        if load is None:
+            raise ValidationError("No delivery partner is available.")
+        order.delivery_person_id = load.courier_id
+        order.update_status("Shipped")
+    return order
@@ -0,0 +1,183 @@
+"""
+Order change events for the admin and delivery dashboards.
+
+Order.save publishes a compact event once its transaction commits. The
+SSE view in api.async_views streams these events to connected dashboards,
+so they no longer poll the order endpoints.
+
+Two brokers share one interface, chosen by ``ORDER_EVENTS_BACKEND``:
+
+* ``memory`` fans events out to subscribers in this process only. Use it
+  for development, tests and single-worker deployments.
+* ``postgres`` publishes with NOTIFY. Each process runs one LISTEN
+  connection on a background thread and hands what it hears to its local
+  subscribers, so every worker sees every event.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "order_events"
+SUBSCRIBER_BUFFER = 100
+
+
+class Subscription:
+    """One listener's buffer of events, read from its own event loop."""
+
+    def __init__(self, broker, loop, predicate=None):
+        self.broker = broker
+        self.loop = loop
+        self.predicate = predicate
+        self.queue = asyncio.Queue(SUBSCRIBER_BUFFER)
+
+    def deliver(self, event):
+        """Hand over ``event``; safe to call from any thread."""
+        if self.predicate is not None and not self.predicate(event):
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's loop is gone
+            self.close()
+
+    def _put(self, event):
+        if self.queue.full():
+            # A stalled client loses its oldest events rather than holding memory
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, predicate=None):
+        """Subscribe the running event loop; ``predicate`` filters the events."""
+        subscription = Subscription(self, asyncio.get_running_loop(), predicate)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        self.deliver(event)
+
+    def deliver(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+
+class PostgresBroker(MemoryBroker):
+    """Fan events out across processes through Postgres LISTEN/NOTIFY."""
+
+    RECONNECT_SECONDS = 1
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__()
+        self.using = using
+        self._listener = None
+
+    def publish(self, event):
+        # NOTIFY payloads are limited to 8000 bytes; events are a few hundred
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(event)])
+
+    def subscribe(self, predicate=None):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="order-events", daemon=True)
+                self._listener.start()
+        return super().subscribe(predicate)
+
+    def _listen(self):
+        while True:
+            # A private connection: the LISTEN must outlive any request
+            wrapper = connections.create_connection(self.using)
+            try:
+                wrapper.ensure_connection()
+                wrapper.set_autocommit(True)
+                with wrapper.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                for payload in self._notifications(wrapper.connection):
+                    self.deliver(json.loads(payload))
+            except Exception:
+                logger.exception("Order event listener lost its connection; reconnecting")
+                time.sleep(self.RECONNECT_SECONDS)
+            finally:
+                wrapper.close()
+
+    @staticmethod
+    def _notifications(raw):
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        if is_psycopg3:
+            for notify in raw.notifies():
+                yield notify.payload
+            return
+        while True:
+            select.select([raw], [], [], 5)
+            raw.poll()
+            while raw.notifies:
+                yield raw.notifies.pop(0).payload
+
+
+BACKENDS = {"memory": MemoryBroker, "postgres": PostgresBroker}
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = BACKENDS[getattr(settings, "ORDER_EVENTS_BACKEND", "memory")]()
+        return _broker
+
+
+def order_event(order, previous_status, kind):
+    return {
+        "type": kind,
+        "id": order.pk,
+        "unique_id": order.unique_id,
+        "status": order.status,
+        "previous_status": previous_status,
+        "total_price": str(order.total_price),
+        "user": order.user_id,
+        "delivery_person": order.delivery_person_id,
+        "order_at": order.order_at.isoformat() if order.order_at else None,
+    }
+
+
+def publish_order_event(order, previous_status, kind):
+    """Broadcast the order's new state once the surrounding transaction commits."""
+    event = order_event(order, previous_status, kind)
+
+    def send():
+        try:
+            broker().publish(event)
+        except Exception:
+            # Dashboards resync on reconnect; a lost event must not fail the write
+            logger.exception("Could not publish order event for order %s", event["id"])
+
+    transaction.on_commit(send)
@@ -0,0 +1,95 @@
+import csv
+import datetime
+import json
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import AdminOrderSerializer
+
+EXPORT_CHUNK_SIZE = 500
+
+CSV_COLUMNS = [
+    "unique_id", "order_at", "status", "total_price", "customer_email",
+    "customer_mobile", "delivery_person_email", "shipping_time", "delivery_time", "items",
+]
+
+
+def _parse_bound(value, name, end=False):
+    """Return ``(moment, whole_day)`` for a ``?from=``/``?to=`` value."""
+    try:
+        # parse_datetime also takes a bare date (as midnight), so try dates first.
+        # Well-formed but impossible values (2024-02-30) raise ValueError.
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else None
+    except ValueError:
+        raise ValidationError({name: "Not a valid date."})
+    if day is not None:
+        # A bare end date includes the whole day
+        if end:
+            day += datetime.timedelta(days=1)
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    elif parsed is None:
+        raise ValidationError({name: "Use YYYY-MM-DD or an ISO 8601 datetime."})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed, day is not None
+
+
+def filter_order_range(queryset, request):
+    """Apply ``?from=`` / ``?to=`` bounds on ``order_at``."""
+    start = request.query_params.get("from")
+    end = request.query_params.get("to")
+    if start:
+        queryset = queryset.filter(order_at__gte=_parse_bound(start, "from")[0])
+    if end:
+        bound, whole_day = _parse_bound(end, "to", end=True)
+        if whole_day:
+            queryset = queryset.filter(order_at__lt=bound)
+        else:
+            queryset = queryset.filter(order_at__lte=bound)
+    return queryset
+
+
+def stream_orders_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one AdminOrderSerializer document per line, a chunk at a time."""
+    for order in queryset.iterator(chunk_size=chunk_size):
+        yield json.dumps(AdminOrderSerializer(order).data, cls=JSONEncoder) + "\n"
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the row back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_row(order):
+    user = order.user
+    courier = order.delivery_person
+    items = "; ".join(
+        f"{purchase.item_name or ''} x{purchase.quantity}"
+        for purchase in order.purchases.all()
+    )
+    return [
+        order.unique_id,
+        order.order_at.isoformat() if order.order_at else "",
+        order.status,
+        order.total_price,
+        user.email if user else "",
+        user.mobile_number if user else "",
+        courier.email if courier else "",
+        order.shipping_time.isoformat() if order.shipping_time else "",
+        order.delivery_time.isoformat() if order.delivery_time else "",
+        items,
+    ]
+
+
+def stream_orders_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield CSV lines for ``queryset`` without holding the export in memory."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for order in queryset.iterator(chunk_size=chunk_size):
+        yield writer.writerow(_csv_row(order))
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+
+GROUPS_VERSION_KEY = "groups:version"
+USER_GROUPS_KEY = "groups:v{version}:user:{user_id}"
+USER_GROUPS_TIMEOUT = 60 * 60
+
+
+def _groups_version():
+    version = cache.get(GROUPS_VERSION_KEY)
+    if version is None:
+        cache.add(GROUPS_VERSION_KEY, 1, timeout=None)
+        version = cache.get(GROUPS_VERSION_KEY, 1)
+    return version
+
+
+def bump_groups_version():
+    """Forget every cached membership, e.g. after a group is renamed or removed."""
+    try:
+        cache.incr(GROUPS_VERSION_KEY)
+    except ValueError:
+        cache.set(GROUPS_VERSION_KEY, 2, timeout=None)
+
+
+def forget_user_groups(user_id):
+    cache.delete(USER_GROUPS_KEY.format(version=_groups_version(), user_id=user_id))
+
+
+def user_groups(user):
+    """Return the user's groups as ``[(id, name), ...]`` without re-querying."""
+    prefetched = getattr(user, "_prefetched_objects_cache", {}).get("groups")
+    if prefetched is not None:
+        return [(group.id, group.name) for group in prefetched]
+
+    key = USER_GROUPS_KEY.format(version=_groups_version(), user_id=user.pk)
+    groups = cache.get(key)
+    if groups is None:
+        groups = list(user.groups.order_by("id").values_list("id", "name"))
+        cache.set(key, groups, USER_GROUPS_TIMEOUT)
+    return groups
+
+
+def user_role(user):
+    """The role LoginView reports: "user" for customers, "admin" for superusers."""
+    names = {name for _, name in user_groups(user)}
+    if "user" in names:
+        return "user"
+    if user.is_superuser:
+        return "admin"
+    return None
@@ -0,0 +1,129 @@
+import string
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALPHABET = string.digits + string.ascii_uppercase
+CODE_LENGTH = 5
+
+# Codes come from an affine permutation of the sequence, so consecutive
+# orders get unrelated-looking codes while no two sequence values ever map
+# to the same code. Both constants must stay coprime with 2 and 3.
+MULTIPLIER = 39916801
+OFFSET = 7654321
+
+# Sequence values each worker reserves per round trip to the database
+BLOCK_SIZE = getattr(settings, "ORDER_CODE_BLOCK_SIZE", 100)
+
+ORDER_CODE_SEQUENCE = "order_unique_id"
+
+
+def code_space(length=CODE_LENGTH):
+    return len(ALPHABET) ** length
+
+
+def encode(value, length=CODE_LENGTH):
+    """Map a sequence value onto a fixed-width code, bijectively."""
+    space = code_space(length)
+    if not 0 <= value < space:
+        raise ValueError(f"Sequence value {value} is outside the {length}-character code space.")
+    n = (value * MULTIPLIER + OFFSET) % space
+    chars = []
+    for _ in range(length):
+        n, rem = divmod(n, len(ALPHABET))
+        chars.append(ALPHABET[rem])
+    return "".join(reversed(chars))
+
+
+def sequence_name(name):
+    return f"{name}_seq"
+
+
+def create_sequence(name, using=DEFAULT_DB_ALIAS):
+    """
+    Create the Postgres sequence behind ``name``, continuing from the
+    Sequence row if one was used before. Run from post_migrate.
+    """
+    from .models import Sequence
+
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    start = Sequence.objects.using(using).filter(name=name).values_list("next_value", flat=True).first() or 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE SEQUENCE IF NOT EXISTS {connection.ops.quote_name(sequence_name(name))} "
+            f"MINVALUE 0 START WITH {int(start)}"
+        )
+
+
+def _reserve_row(connection, name, size):
+    from .models import Sequence
+
+    table = connection.ops.quote_name(Sequence._meta.db_table)
+    with connection.cursor() as cursor:
+        for _ in range(2):
+            cursor.execute(
+                f"UPDATE {table} SET next_value = next_value + %s WHERE name = %s RETURNING next_value",
+                [size, name],
+            )
+            row = cursor.fetchone()
+            if row is not None:
+                return range(row[0] - size, row[0])
+            cursor.execute(f"INSERT INTO {table} (name, next_value) VALUES (%s, 0) ON CONFLICT (name) DO NOTHING", [name])
+    raise RuntimeError(f"Could not reserve values from sequence {name!r}.")
+
+
+def reserve_block(name, size):
+    """
+    Claim up to ``size`` sequence values that no other caller will get.
+
+    A claim must outlive the caller's transaction: if it were rolled back
+    with an order while the allocator kept the block, the same values would
+    be handed out again. Postgres sequences are never rolled back. Other
+    databases keep a Sequence row instead; inside a transaction only one
+    value is claimed, so a rollback takes back nothing that was kept.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [sequence_name(name), size])
+            return [row[0] for row in cursor.fetchall()]
+    return _reserve_row(connection, name, 1 if connection.in_atomic_block else size)
+
+
+class BlockAllocator:
+    """Hand out sequence values from blocks reserved once per ``block_size``."""
+
+    def __init__(self, name, block_size=BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._values = deque()
+
+    def __call__(self):
+        with self._lock:
+            if not self._values:
+                self._values.extend(reserve_block(self.name, self.block_size))
+            return self._values.popleft()
+
+    def peek(self):
+        """The value the next call will return."""
+        with self._lock:
+            if not self._values:
+                self._values.extend(reserve_block(self.name, self.block_size))
+            return self._values[0]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+order_sequence = BlockAllocator(ORDER_CODE_SEQUENCE)
+
+
+def next_order_code():
+    """Return a public order code that no other allocated order uses."""
+    return encode(order_sequence())
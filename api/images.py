@@ -0,0 +1,138 @@
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Longest edge in pixels for each responsive variant
+VARIANT_SIZES = {
+    "thumb": 160,
+    "card": 480,
+    "detail": 1080,
+}
+
+VARIANT_FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True},
+}
+
+ORIGINAL_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _open(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    # Bake the EXIF orientation into the pixels before the metadata is dropped
+    return ImageOps.exif_transpose(image)
+
+
+def _encode(image, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def _flatten(image):
+    """JPEG has no alpha channel: composite transparent images onto white."""
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _save(name, data):
+    # Names are content addressed, so an existing file is already the right one
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def store_original(data, folder):
+    """Store the upload without metadata under its content hash; return its name."""
+    source_format = Image.open(io.BytesIO(data)).format
+    image_format = source_format if source_format in ORIGINAL_FORMATS else "PNG"
+    name = f"{folder}/{content_hash(data)}.{ORIGINAL_FORMATS[image_format]}"
+    if default_storage.exists(name):
+        return name
+
+    image = _open(data)
+    if image_format == "JPEG":
+        encoded = _encode(_flatten(image), format="JPEG", quality=90, optimize=True)
+    else:
+        encoded = _encode(image, format=image_format, optimize=True)
+    return _save(name, encoded)
+
+
+def build_variants(name):
+    """
+    Render every size and format of a stored original.
+
+    Returns ``{"thumb": {"width": 160, "webp": name, "jpeg": name}, ...}``.
+    Sizes larger than the original are skipped; the smallest is always kept.
+    """
+    with default_storage.open(name) as source:
+        image = _open(source.read())
+    stem = name.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+
+    variants = {}
+    for label, edge in sorted(VARIANT_SIZES.items(), key=lambda item: item[1]):
+        if variants and edge > max(image.size):
+            break
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        variant = {"width": resized.width}
+        for extension, options in VARIANT_FORMATS.items():
+            rendered = resized if extension == "webp" else _flatten(resized)
+            variant[extension] = _save(f"variants/{stem}/{label}.{extension}", _encode(rendered, **options))
+        variants[label] = variant
+    return variants
+
+
+def process_image_field(instance, field_name="image", folder="images"):
+    """
+    Store a freshly uploaded image before the model saves.
+
+    Identical uploads resolve to the same stored file, so re-uploading a dish
+    photo doesn't create another copy. Returns True when a new upload was
+    stored and its variants still need rendering (see api.tasks); already
+    stored images, and uploads of the photo the row already has, keep their
+    variants.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        instance.image_variants = {}
+        return False
+    if field_file._committed:
+        return False
+
+    field_file.seek(0)
+    name = store_original(field_file.read(), folder)
+    setattr(instance, field_name, name)
+    if instance.pk is not None:
+        stored = type(instance)._default_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+        if stored == name:
+            return False
+    instance.image_variants = {}
+    return True
+
+
+def variant_srcset(variants, extension):
+    """Format one extension's variants as an HTML ``srcset`` value."""
+    return ", ".join(
+        f"{default_storage.url(variant[extension])} {variant['width']}w"
+        for variant in sorted(variants.values(), key=lambda variant: variant["width"])
+        if extension in variant
+    )
+
+
+def image_srcset(variants):
+    if not variants:
+        return None
+    return {extension: variant_srcset(variants, extension) for extension in VARIANT_FORMATS}
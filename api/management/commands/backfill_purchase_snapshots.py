@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.checkout import backfill_purchase_snapshots
+
+
+class Command(BaseCommand):
+    help = "Copy the dish name, category, image, rating and unit price onto purchases that predate snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = backfill_purchase_snapshots(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} purchases."))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import test_database
+from api.benchmarks.endpoints import BASELINE_PATH, DATASET, SCENARIOS, compare, load_baseline, run, save_baseline, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API endpoints (latency, queries, allocations) on a seeded test "
+        "database and fail on regressions against the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", action="append", dest="endpoints", choices=sorted(SCENARIOS),
+                            help="Endpoint to measure; repeat for several (default: all).")
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        for name, default in DATASET.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=int, default=default)
+        parser.add_argument("--baseline", default=str(BASELINE_PATH))
+        parser.add_argument("--update-baseline", action="store_true",
+                            help="Write these results as the new baseline instead of comparing.")
+        parser.add_argument("--alloc-tolerance", type=float, default=0.5,
+                            help="Allowed allocation growth as a fraction (default 0.5).")
+        parser.add_argument("--latency-tolerance", type=float, default=None,
+                            help="Allowed p95 growth as a fraction; latency is not compared unless set.")
+
+    def handle(self, *args, **options):
+        dataset = {name: options[name] for name in DATASET}
+        names = options["endpoints"] or list(SCENARIOS)
+        with test_database():
+            context = seed(**dataset)
+            results = run(names, context, options["requests"], options["warmup"])
+
+        self.stdout.write(f"{'endpoint':<12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'alloc KiB':>10}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<12} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+                f"{row['queries']:>8} {row['alloc_kib']:>10.1f}"
+            )
+
+        if options["update_baseline"]:
+            save_baseline(results, dataset, options["baseline"])
+            self.stdout.write(self.style.SUCCESS(f"Wrote baseline to {options['baseline']}."))
+            return
+
+        baseline = load_baseline(options["baseline"])
+        if baseline["dataset"] != dataset:
+            self.stdout.write(self.style.WARNING("Dataset differs from the baseline's; comparing query counts only."))
+        regressions = compare(results, baseline, dataset, options["alloc_tolerance"], options["latency_tolerance"])
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
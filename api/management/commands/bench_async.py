@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import test_database
+from api.benchmarks.async_views import ROUTES, run, seed
+
+
+class Command(BaseCommand):
+    help = "Compare requests/second of the sync views and their async (ASGI) versions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--route", action="append", dest="routes", choices=sorted(ROUTES),
+                            help="Route to measure; repeat for several (default: all).")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--items", type=int, default=500)
+        parser.add_argument("--orders", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with test_database():
+            seed(items=options["items"], orders=options["orders"])
+            results = run(options["routes"] or sorted(ROUTES), options["requests"], options["concurrency"])
+        self.stdout.write(f"{'route':<10} {'mode':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for row in results:
+            self.stdout.write(
+                f"{row['route']:<10} {row['mode']:<6} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+            )
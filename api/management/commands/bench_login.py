@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import test_database
+from api.benchmarks.login import run
+
+
+class Command(BaseCommand):
+    help = "Measure login p50/p99 under a concurrent login storm for each password-hasher profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profile", action="append", dest="profiles",
+                            choices=sorted(settings.PASSWORD_HASHER_PROFILES),
+                            help="Profile to measure; repeat for several (default: all).")
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+
+    def handle(self, *args, **options):
+        profiles = options["profiles"] or sorted(settings.PASSWORD_HASHER_PROFILES)
+        with test_database():
+            results = run(profiles, options["users"], options["logins"], options["concurrency"])
+        self.stdout.write(f"{'profile':<10} {'queries':>7} {'p50 ms':>8} {'p99 ms':>8} {'logins/s':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['profile']:<10} {row['queries']:>7} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['throughput']:>9.1f}"
+            )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api.benchmarks.order_ids import run
+
+
+class Command(BaseCommand):
+    help = "Show order code retries per order at increasing fill levels, random codes vs the allocator."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--length", type=int, default=3, help="Code length to simulate.")
+        parser.add_argument("--samples", type=int, default=2000, help="Orders placed per fill level.")
+        parser.add_argument("--legacy", type=int, default=50, help="Random codes issued before the allocator.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'fill':>6}  {'random mean':>11} {'p99':>5} {'max':>5}  {'allocator mean':>14} {'p99':>5} {'max':>5}"
+        )
+        for row in run(options["length"], options["samples"], options["legacy"], options["seed"]):
+            old, new = row["random"], row["allocator"]
+            self.stdout.write(
+                f"{row['fill']:>6.0%}  {old['mean']:>11.2f} {old['p99']:>5} {old['max']:>5}"
+                f"  {new['mean']:>14.2f} {new['p99']:>5} {new['max']:>5}"
+            )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min, Sum
+
+from api.models import CartItem, Item
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge duplicate cart rows for the same user and dish into the oldest one. "
+        "Run before migrating onto the unique (user, dish) constraint."
+    )
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if CartItem._meta.db_table not in connection.introspection.table_names(cursor):
+                self.stdout.write("Cart table does not exist yet, nothing to merge.")
+                return
+
+        merged = 0
+        with transaction.atomic():
+            duplicates = (
+                CartItem.objects.filter(user__isnull=False, dish__isnull=False)
+                .values("user", "dish")
+                .annotate(rows=Count("id"), keep=Min("id"), quantity=Sum("quantity"))
+                .filter(rows__gt=1)
+            )
+            # This runs before migrate, so the code may know Item columns the
+            # table doesn't have yet: only ever read the ones named here
+            for group in duplicates:
+                price = Item.objects.filter(pk=group["dish"]).values_list("selling_price", flat=True).first()
+                CartItem.objects.filter(user=group["user"], dish=group["dish"]).exclude(pk=group["keep"]).delete()
+                CartItem.objects.filter(pk=group["keep"]).update(
+                    quantity=group["quantity"],
+                    total_price=group["quantity"] * price if price is not None else None,
+                )
+                merged += group["rows"] - 1
+
+        self.stdout.write(self.style.SUCCESS(f"Merged {merged} duplicate cart rows."))
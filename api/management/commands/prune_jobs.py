@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from api.queue import FAILED_JOB_RETENTION_DAYS, JOB_RETENTION_DAYS, prune
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete finished and failed background jobs older than their retention period. "
+        "Run it daily (e.g. from cron) so the job table stays small."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=JOB_RETENTION_DAYS, help="Days to keep finished jobs.")
+        parser.add_argument(
+            "--failed-days", type=int, default=FAILED_JOB_RETENTION_DAYS,
+            help="Days to keep failed jobs, so their errors can still be looked at.",
+        )
+
+    def handle(self, *args, **options):
+        current = now()
+        deleted = prune(
+            current - timedelta(days=options["days"]),
+            current - timedelta(days=options["failed_days"]),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} jobs."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.dispatch import rebuild_courier_loads
+
+
+class Command(BaseCommand):
+    help = "Recreate every delivery partner's active-order count from the orders table."
+
+    def handle(self, *args, **options):
+        couriers = rebuild_courier_loads()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt loads for {couriers} delivery partners."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.ratings import rebuild_item_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute every item's rating sum and count from its reviews in one pass."
+
+    def handle(self, *args, **options):
+        updated = rebuild_item_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} items."))
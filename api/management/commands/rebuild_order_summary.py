@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.summary import rebuild_order_summary
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-status order counters and revenue from the orders table."
+
+    def handle(self, *args, **options):
+        for row in rebuild_order_summary():
+            self.stdout.write(f"{row['status']}: {row['count']} orders, {row['revenue'] or 0}")
+        self.stdout.write(self.style.SUCCESS("Order summary rebuilt."))
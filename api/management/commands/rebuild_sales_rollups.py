@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from api.analytics import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the hourly and daily sales rollups from the order lines, one day at a time. "
+        "Safe to rerun; use it to catch up after downtime or to fill in history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=date.fromisoformat, help="First day (YYYY-MM-DD); default the first order's day.")
+        parser.add_argument("--until", type=date.fromisoformat, help="Last day (YYYY-MM-DD); default today.")
+        parser.add_argument("--missing", action="store_true", help="Skip days that already have daily rollups.")
+
+    def handle(self, *args, **options):
+        days = rebuild_sales_rollups(options["since"], options["until"], missing=options["missing"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollups for {days} days."))
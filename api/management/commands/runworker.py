@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+import api.tasks  # noqa: F401  Registers the jobs
+from api.queue import Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (image variants, notifications, aggregate refreshes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="Jobs run concurrently.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Run the jobs that are due now, then exit.")
+
+    def handle(self, *args, **options):
+        worker = Worker(threads=options["threads"], poll_interval=options["poll_interval"])
+        if options["once"]:
+            ran = worker.run_once()
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs."))
+            return
+        self.stdout.write(f"Worker started with {options['threads']} threads.")
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped.")
@@ -0,0 +1,259 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware times every request and the database queries,
+serialization and response rendering inside it. It reports them to the
+client as a ``Server-Timing`` header and adds them to per-route
+histograms, which MetricsView exposes in the Prometheus text format.
+Histograms are kept per process; Prometheus scrapes and sums each worker.
+
+Serialization is the evaluation of ``.data`` on serializers that use
+TimedSerializerMixin, which views mostly do before they return; it
+includes any queries a lazy queryset runs while being serialized, so those
+count towards both "db" and "serialize". Rendering is encoding the
+finished data as JSON afterwards. The middleware runs natively under both
+WSGI and ASGI, and counts queries made on the worker threads of the async
+views (api.async_views) as well.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.serializers import ListSerializer
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+UNMATCHED_ROUTE = "<unmatched>"
+
+METRICS = {
+    "duration": ("http_request_duration_seconds", "Wall time per request.", SECONDS_BUCKETS),
+    "queries": ("http_request_db_queries", "Database queries per request.", QUERY_BUCKETS),
+    "db": ("http_request_db_duration_seconds", "Time spent in database queries per request.", SECONDS_BUCKETS),
+    "serialize": ("http_request_serialize_duration_seconds", "Time spent evaluating serializer data.", SECONDS_BUCKETS),
+    "render": ("http_request_render_duration_seconds", "Time spent encoding the response body.", SECONDS_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class Registry:
+    """Histograms keyed by metric and (method, route), safe across threads."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, **values):
+        with self._lock:
+            for metric, value in values.items():
+                key = (metric, method, route)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(METRICS[metric][2])
+                histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """The Prometheus text exposition of every histogram."""
+        with self._lock:
+            lines = []
+            for metric, (name, help_text, buckets) in METRICS.items():
+                series = sorted(key for key in self._histograms if key[0] == metric)
+                if not series:
+                    continue
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for key in series:
+                    histogram = self._histograms[key]
+                    labels = f'method="{key[1]}",route="{_escape(key[2])}"'
+                    for bound, count in zip(buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+registry = Registry()
+
+
+class RequestTimer:
+    """Queries and serializer time of one request, added to from any thread it uses."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **durations):
+        # Async views query and serialize on several threads at once
+        with self._lock:
+            for name, value in durations.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+# The timer of the request being handled. Context variables follow the
+# request into sync_to_async threads, so work there is counted too.
+_request_timer = ContextVar("request_timer", default=None)
+# Set while a serializer's data is being built, so nested serializers aren't counted twice
+_serializing = ContextVar("serializing", default=False)
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; counts for the current request."""
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.add(queries=1, db=time.perf_counter() - start)
+
+
+def _install_query_timer(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(connection_created)
+def _time_new_connection(sender, connection, **kwargs):
+    # Each thread opens its own connections; time them all
+    _install_query_timer(connection)
+
+
+def _timed_data(data):
+    timer = _request_timer.get()
+    if timer is None or _serializing.get():
+        return data()
+    token = _serializing.set(True)
+    start = time.perf_counter()
+    try:
+        return data()
+    finally:
+        timer.add(serialize=time.perf_counter() - start)
+        _serializing.reset(token)
+
+
+class TimedListSerializer(ListSerializer):
+    @property
+    def data(self):
+        return _timed_data(lambda: super(TimedListSerializer, self).data)
+
+
+class TimedSerializerMixin:
+    """
+    Count the time spent building this serializer's ``.data`` towards the
+    request's "serialize" timing. ``many=True`` instances get a timed list
+    serializer unless Meta names its own.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        meta = cls.__dict__.get("Meta")
+        if meta is not None and not hasattr(meta, "list_serializer_class"):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        return _timed_data(lambda: super(TimedSerializerMixin, self).data)
+
+
+def route_of(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else UNMATCHED_ROUTE
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        timer, token, start = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self._finish(request, response, timer, start)
+
+    async def _acall(self, request):
+        timer, token, start = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self._finish(request, response, timer, start)
+
+    def _start(self, request):
+        # Connections opened before this module was imported missed connection_created
+        for connection in connections.all(initialized_only=True):
+            _install_query_timer(connection)
+        request._render_time = 0.0
+        timer = RequestTimer()
+        return timer, _request_timer.set(timer), time.perf_counter()
+
+    def _finish(self, request, response, timer, start):
+        duration = time.perf_counter() - start
+        route = route_of(request)
+        registry.observe(
+            request.method, route,
+            duration=duration, queries=timer.queries, db=timer.db,
+            serialize=timer.serialize, render=request._render_time,
+        )
+        response["Server-Timing"] = (
+            f"app;dur={duration * 1000:.1f}, "
+            f'db;dur={timer.db * 1000:.1f};desc="{timer.queries} queries", '
+            f"serialize;dur={timer.serialize * 1000:.1f}, "
+            f"render;dur={request._render_time * 1000:.1f}"
+        )
+        if duration * 1000 >= settings.SLOW_REQUEST_MS:
+            logger.warning(
+                "Slow request method=%s route=%s status=%s duration_ms=%.1f queries=%d db_ms=%.1f",
+                request.method, route, response.status_code, duration * 1000, timer.queries, timer.db * 1000,
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render (serialize to JSON) after the view returns
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
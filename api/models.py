@@ -1,11 +1,17 @@
 from django.db import models
+import logging
 import random
 import string
 from django.contrib.auth.models import Group, AbstractUser
-from django.db import models, connection
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import BaseUserManager
 
+from .images import process_image_field
+
+logger = logging.getLogger(__name__)
+
 class AlphaNumericFieldfive(models.CharField):
     def __init__(self, *args, **kwargs):
         kwargs["max_length"] = 5  # Set fixed max_length for alphanumeric field
@@ -53,10 +59,17 @@ class CustomUser(AbstractUser):
     address = models.CharField(max_length=255, blank=True, null=True)
     city = models.CharField(max_length=100)
     image = models.ImageField(blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # See api.images
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
 
+    def save(self, *args, **kwargs):
+        new_image = process_image_field(self, folder="users")
+        super().save(*args, **kwargs)
+        if new_image:
+            queue_image_variants(self)
+
     def __str__(self):
         return f"{self.email} - {self.mobile_number}"
 
@@ -80,7 +93,7 @@ def create_groups(sender, **kwargs):
             for group_name in groups:
                 Group.objects.get_or_create(name=group_name)
         else:
-            print("auth_group table does not exist, skipping group creation.")
+            logger.info("auth_group table does not exist, skipping group creation.")
 
 
 
@@ -94,12 +107,43 @@ class Item(models.Model):
     category = models.CharField(max_length=100,blank=True, null=True)
     available = models.BooleanField(default=True,blank=True, null=True)
     image = models.ImageField(blank=True,null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)  # See api.images
+    # Maintained from Review rows by api.ratings; never edit by hand
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Category pages and related items, keyset-paginated on id
+            models.Index(fields=['category', 'id'], name='item_category_id'),
+            models.Index(fields=['category', 'id'], condition=Q(available=True), name='item_available_category_id'),
+        ]
+
+    @property
+    def average_rating(self):
+        """Live average of the item's reviews, falling back to the static rating."""
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
+        return self.ratings
     
     # @property
     # def selling_price(self):
     #     discount = (int(self.offer_percentage) / 100) * self.mrp_price
     #     return self.mrp_price - discount
 
+    def save(self, *args, **kwargs):
+        new_image = process_image_field(self, folder="items")
+        if not self._state.adding and not args and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            # Reviews move the aggregates with F() updates; writing back this
+            # instance's copy would undo every review saved since it was loaded
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ("rating_sum", "rating_count")
+            ]
+        super().save(*args, **kwargs)
+        if new_image:
+            queue_image_variants(self)
+
     def __str__(self):
         return f"{self.name} - Selling Price: {self.selling_price}"
 
@@ -112,6 +156,32 @@ class Review(models.Model):
     rating = models.PositiveIntegerField(default=0,blank=True, null=True)
     message = models.TextField(blank=True, null=True)
 
+    # (item_id, rating) as last read from or written to the database
+    _tracked_state = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'item_id' in instance.__dict__ and 'rating' in instance.__dict__:
+            instance._tracked_state = instance.rating_state()
+        return instance
+
+    def rating_state(self):
+        return (self.item_id, self.rating)
+
+    def save(self, *args, **kwargs):
+        previous = None
+        if not self._state.adding:
+            previous = self._tracked_state
+            if previous is None:
+                previous = Review.objects.filter(pk=self.pk).values_list('item_id', 'rating').first()
+
+        # Keep the item's rating aggregates in step with its reviews
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            record_rating_change(previous, self.rating_state())
+        self._tracked_state = self.rating_state()
+
     def __str__(self):
         return f"{self.email}"
 
@@ -123,9 +193,18 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1,blank=True, null=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2,blank=True, null=True)
 
+    class Meta:
+        # One row per dish in a basket; see the dedupe_cart_items command
+        constraints = [models.UniqueConstraint(fields=['user', 'dish'], name='unique_cart_item')]
+
     def save(self, *args, **kwargs):
-        # Automatically calculate the total price when saving
-        self.total_price = self.quantity * self.dish.selling_price
+        # Automatically calculate the total price when saving; only the price
+        # is read when the dish itself wasn't loaded
+        if CartItem.dish.is_cached(self):
+            price = self.dish.selling_price if self.dish else None
+        else:
+            price = Item.objects.filter(pk=self.dish_id).values_list('selling_price', flat=True).first()
+        self.total_price = self.quantity * price if price is not None else None
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -134,6 +213,29 @@ class CartItem(models.Model):
 
 
 from django.utils.timezone import now
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_purchases(self):
+        """Load every order's purchases in one extra query; lines carry their own item snapshot."""
+        return self.prefetch_related('purchases')
+
+    def with_details(self):
+        """Everything AdminOrderSerializer reads, in a constant number of queries."""
+        return self.with_purchases().select_related('user', 'delivery_person').prefetch_related(
+            'user__groups', 'delivery_person__groups'
+        )
+
+
+class OrderManager(models.Manager.from_queryset(OrderQuerySet)):
+    pass
+
+
+class DetailedOrderManager(OrderManager):
+    def get_queryset(self):
+        return super().get_queryset().with_details()
+
+
 class Order(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders',blank=True, null=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0,blank=True, null=True)
@@ -143,17 +245,72 @@ class Order(models.Model):
     delivery_time = models.DateTimeField(blank=True, null=True, help_text="Time when the order was delivered.")
     delivery_person =models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='delivery_person',blank=True, null=True)
     unique_id = AlphaNumericFieldfive(unique=True, editable=False,null=True, blank=False)
+
+    objects = OrderManager()
+    detailed = DetailedOrderManager()  # Prefetches everything the order serializers read
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-order_at'], name='order_status_order_at'),
+            models.Index(fields=['-order_at'], name='order_order_at'),
+            models.Index(fields=['user', '-order_at'], name='order_user_order_at'),
+        ]
+
+    # tracked_state() as last read from or written to the database
+    _tracked_state = None
+    TRACKED_FIELDS = ('status', 'total_price', 'delivery_person_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(field in instance.__dict__ for field in cls.TRACKED_FIELDS):
+            instance._tracked_state = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        """What the status counters (api.summary) and courier loads (api.dispatch) follow."""
+        return (self.status, self.total_price, self.delivery_person_id)
+
+    def summary_state(self):
+        return (self.status, self.total_price)
+
     def update_total_price(self):
         # Calculate the total price based on associated ItemPurchase objects
         self.total_price = sum(item.total_price for item in self.purchases.all())
         self.save()
 
+    # Fresh codes never collide with each other; retries only cover codes
+    # handed out before the allocator existed.
+    UNIQUE_ID_ATTEMPTS = 5
+
     def save(self, *args, **kwargs):
-        if not self.unique_id:
-            self.unique_id = AlphaNumericFieldfive.generate_alphanumeric()
-            while Order.objects.filter(unique_id=self.unique_id).exists():
-                self.unique_id = AlphaNumericFieldfive.generate_alphanumeric()
-        super(Order, self).save(*args, **kwargs)
+        generated = not self.unique_id
+        if generated:
+            self.unique_id = next_order_code()
+
+        previous = None
+        if not self._state.adding:
+            previous = self._tracked_state
+            if previous is None:
+                previous = Order.objects.filter(pk=self.pk).values_list(*self.TRACKED_FIELDS).first()
+
+        for attempt in range(self.UNIQUE_ID_ATTEMPTS):
+            try:
+                # Keep the status counters and courier loads in step with the row
+                with transaction.atomic():
+                    super(Order, self).save(*args, **kwargs)
+                    record_order_change(previous and previous[:2], self.summary_state())
+                    record_courier_change(previous, self.tracked_state())
+                    if previous is None or previous[0] != self.status:
+                        queue_status_notification(self)
+                        queue_sales_rollups([self])
+                    publish_order_event(self, previous and previous[0], 'created' if previous is None else 'updated')
+                break
+            except IntegrityError:
+                if not generated or attempt == self.UNIQUE_ID_ATTEMPTS - 1:
+                    raise
+                self.unique_id = next_order_code()
+        self._tracked_state = self.tracked_state()
 
 
     def update_status(self, new_status):
@@ -175,23 +332,218 @@ class Order(models.Model):
 
 
 
+class Sequence(models.Model):
+    """Named counter that workers reserve blocks of values from (see api.ids)."""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+
+class OrderStatusSummary(models.Model):
+    """Running order count and revenue per status, maintained by Order.save."""
+    status = models.CharField(max_length=20, unique=True)
+    count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.status}: {self.count} orders, {self.revenue}"
+
+
+
+class CourierLoad(models.Model):
+    """Shipped orders each delivery partner is carrying, maintained by Order.save (see api.dispatch)."""
+    courier = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='load')
+    active_orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Least-loaded courier is the first entry of this index
+        indexes = [models.Index(fields=['active_orders', 'courier'], name='courier_load_order')]
+
+    def __str__(self):
+        return f"{self.courier_id}: {self.active_orders} active orders"
+
+
+
+class SalesRollup(models.Model):
+    """Units and revenue per hour or day, item, category and order status (see api.analytics)."""
+    granularity = models.CharField(max_length=10, choices=[('hour', 'Hour'), ('day', 'Day')])
+    bucket = models.DateTimeField()
+    item = models.ForeignKey(Item, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    item_name = models.CharField(max_length=200, blank=True, null=True)
+    category = models.CharField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=20, blank=True, null=True)
+    lines = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        # Reports and refreshes both select a granularity and a bucket range
+        indexes = [models.Index(fields=['granularity', 'bucket'], name='sales_rollup_bucket')]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.item_name}: {self.revenue}"
+
+
+
+class Job(models.Model):
+    """A unit of deferred work for `manage.py runworker` (see api.queue)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=[(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')], default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=now)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    idempotency_key = models.CharField(max_length=200, unique=True, blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+
 class ItemPurchase(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='purchases' ,blank=True, null=True)
-    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='purchases',blank=True, null=True)
+    # Deleting a dish keeps the order history; the line still has its snapshot
+    item = models.ForeignKey(Item, on_delete=models.SET_NULL, related_name='purchases',blank=True, null=True)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='purchases',blank=True, null=True)  # Add this field
     quantity = models.PositiveIntegerField(default=1,blank=True, null=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2,blank=True, null=True)
     purchased_at = models.DateTimeField(auto_now=True,blank=True, null=True)
+    # The item as it was when purchased; see snapshot_item and backfill_purchase_snapshots
+    item_name = models.CharField(max_length=200, blank=True, null=True)
+    item_category = models.CharField(max_length=100, blank=True, null=True)
+    item_image = models.ImageField(blank=True, null=True)
+    item_rating = models.FloatField(blank=True, null=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+
+    def snapshot_item(self, item):
+        """Point the line at ``item`` and copy what order history shows of it."""
+        self.item = item
+        self.item_name = item.name
+        self.item_category = item.category
+        self.item_image = item.image.name or None
+        self.item_rating = item.average_rating
+        self.unit_price = item.selling_price
+        return self
 
     def save(self, *args, **kwargs):
-        self.total_price = self.quantity * self.item.selling_price
+        if self.unit_price is None and self.item_id is not None:
+            self.snapshot_item(self.item)
+        if self.unit_price is not None:
+            self.total_price = self.quantity * self.unit_price
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.user.username} purchased {self.quantity} x {self.item.name}"
+        return f"{self.user.username} purchased {self.quantity} x {self.item_name}"
+
+
+
+
 
 
 
 
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
+from rest_framework.authtoken.models import Token
 
+from .authentication import invalidate_token, invalidate_user
+from .catalog import bump_catalog_version
+from .dispatch import COURIER_GROUP, forget_courier, record_courier_change, sync_couriers
+from .events import publish_order_event
+from .groups import bump_groups_version, forget_user_groups
+from .ids import ORDER_CODE_SEQUENCE, create_sequence, next_order_code
+from .ratings import record_rating_change
+from .search import create_search_indexes
+from .tasks import queue_image_variants, queue_sales_rollups, queue_status_notification
+from .summary import record_order_change
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog(sender, **kwargs):
+    # Not before commit: a menu rebuilt in between would cache the old rows
+    # under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_summary(sender, instance, **kwargs):
+    state = instance._tracked_state or instance.tracked_state()
+    record_order_change(state[:2], None)
+    record_courier_change(state, None)
+    queue_sales_rollups([instance])
+    publish_order_event(instance, instance.status, "deleted")
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+    forget_courier(instance.pk)
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def forget_changed_memberships(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        forget_user_groups(instance.pk)
+        sync_couriers([instance.pk])
+    elif pk_set:
+        for user_id in pk_set:
+            forget_user_groups(user_id)
+        if instance.name == COURIER_GROUP:
+            sync_couriers(pk_set)
+    else:
+        # group.user_set.clear() doesn't say which users were removed
+        bump_groups_version()
+        sync_couriers()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_group_names(sender, **kwargs):
+    bump_groups_version()
+    # A renamed or deleted group may have been the couriers'
+    sync_couriers()
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    record_rating_change(instance._tracked_state or instance.rating_state(), None)
+
+
+@receiver(post_migrate)
+def add_search_indexes(sender, using, **kwargs):
+    # Expression and pg_trgm indexes that model Meta can't express portably
+    if sender.name == "api":
+        create_search_indexes(using)
+
+
+@receiver(post_migrate)
+def add_order_code_sequence(sender, using, **kwargs):
+    # Order codes come from a real sequence on Postgres (see api.ids)
+    if sender.name == "api":
+        create_sequence(ORDER_CODE_SEQUENCE, using)
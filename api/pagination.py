@@ -0,0 +1,69 @@
+from rest_framework.exceptions import ValidationError
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def query_params(request):
+    """GET parameters of a DRF Request or a plain Django HttpRequest."""
+    return getattr(request, "query_params", request.GET)
+
+
+def page_limit(request, default=DEFAULT_PAGE_SIZE):
+    """Read ``?limit=`` from the request, clamped to ``MAX_PAGE_SIZE``."""
+    raw = query_params(request).get("limit")
+    if raw in (None, ""):
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValidationError({"limit": "Must be an integer."})
+    if limit < 1:
+        raise ValidationError({"limit": "Must be at least 1."})
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_page(queryset, request, descending=False, default_limit=DEFAULT_PAGE_SIZE):
+    """
+    Slice ``queryset`` after the ``?cursor=`` id and return ``(rows, next_cursor)``.
+
+    Pages are keyed on the primary key, so every page is an index range scan
+    no matter how deep the client has scrolled.
+    """
+    limit = page_limit(request, default_limit)
+    cursor = query_params(request).get("cursor")
+    if cursor not in (None, ""):
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            raise ValidationError({"cursor": "Invalid cursor."})
+        queryset = queryset.filter(**{"id__lt" if descending else "id__gt": cursor})
+
+    rows = list(queryset.order_by("-id" if descending else "id")[: limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return rows, next_cursor
+
+
+def cursor_headers(next_cursor):
+    """Headers advertising the next page for list-shaped responses."""
+    if next_cursor is None:
+        return {}
+    return {NEXT_CURSOR_HEADER: str(next_cursor)}
+
+
+def requested_fields(request, allowed):
+    """Parse ``?fields=a,b`` into a list restricted to ``allowed`` (or None)."""
+    raw = query_params(request).get("fields")
+    if not raw:
+        return None
+    fields = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise ValidationError({"fields": f"Unknown fields: {', '.join(unknown)}"})
+    if "id" not in fields:
+        fields.insert(0, "id")
+    return fields
@@ -0,0 +1,55 @@
+"""
+Independent pieces of the catalog and admin dashboard responses.
+
+Each function runs its own queries and returns plain data, so the sync
+views can call them in turn and the async views (api.async_views) can run
+them concurrently. Parts that need no serializer also come as a coroutine
+on the async ORM (``a``-prefixed).
+"""
+from .dispatch import courier_roster
+from .models import Item, Order
+from .pagination import keyset_page
+from .serializers import ItemSerializer, OrderSerializer
+
+
+def _categories(limit):
+    return Item.objects.values_list('category', flat=True).distinct()[:limit]
+
+
+def shop_categories(limit=6):
+    return [category for category in _categories(limit) if category]  # Remove None or blank categories
+
+
+async def ashop_categories(limit=6):
+    return [category async for category in _categories(limit) if category]
+
+
+def new_arrivals(fields, limit=6):
+    items = ItemSerializer.project(Item.objects.all(), fields).order_by('-id')[:limit]
+    return ItemSerializer(items, many=True, fields=fields).data
+
+
+def catalog_page(request, fields):
+    """Return ``(items, next_cursor)`` for one keyset page of the catalog."""
+    return keyset_page(ItemSerializer.project(Item.objects.all(), fields), request)
+
+
+def shop_payload(categories, new_arrival, page, fields):
+    # The page's cursor goes in the X-Next-Cursor header, as on every paginated endpoint
+    # Reuse the new arrivals already serialized when they land on this page
+    serialized = {row['id']: row for row in new_arrival}
+    fresh = ItemSerializer([item for item in page if item.id not in serialized], many=True, fields=fields).data
+    serialized.update((row['id'], row) for row in fresh)
+    return {
+        "categories": categories,
+        "new_arrival": new_arrival,
+        "all_dishes": [serialized[item.id] for item in page],
+    }
+
+
+def latest_orders(count):
+    return OrderSerializer(Order.objects.with_purchases().order_by('-order_at')[:count], many=True).data
+
+
+def delivery_partners():
+    return courier_roster()
@@ -0,0 +1,189 @@
+import logging
+import random
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+# Seconds a claimed job may run before another worker may take it over
+LEASE_SECONDS = 300
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60 * 60
+
+# Days finished and failed jobs are kept before `manage.py prune_jobs` deletes them
+JOB_RETENTION_DAYS = getattr(settings, "JOB_RETENTION_DAYS", 7)
+FAILED_JOB_RETENTION_DAYS = getattr(settings, "FAILED_JOB_RETENTION_DAYS", 30)
+
+_registry = {}
+
+
+def task(name, max_attempts=5):
+    """Register a function as a job the worker can run by ``name``."""
+    def decorator(func):
+        _registry[name] = func
+        func.task_name = name
+        func.max_attempts = max_attempts
+        return func
+    return decorator
+
+
+def enqueue(func, idempotency_key=None, delay=0, **payload):
+    """
+    Queue ``func(**payload)`` for the worker.
+
+    The job row is written in the caller's transaction, so it only becomes
+    visible if the surrounding write commits. A job whose ``idempotency_key``
+    was already queued is not queued again.
+    """
+    from .models import Job
+
+    if getattr(settings, "TASK_QUEUE_EAGER", False):
+        transaction.on_commit(lambda: func(**payload))
+        return None
+
+    job = Job(
+        name=func.task_name,
+        payload=payload,
+        max_attempts=func.max_attempts,
+        run_at=now() + timedelta(seconds=delay),
+        idempotency_key=idempotency_key,
+    )
+    Job.objects.bulk_create([job], ignore_conflicts=idempotency_key is not None)
+    return job
+
+
+def enqueue_many(func, calls, delay=0):
+    """Queue ``func`` once per ``(idempotency_key, payload)`` in ``calls`` with one INSERT."""
+    from .models import Job
+
+    calls = list(calls)
+    if getattr(settings, "TASK_QUEUE_EAGER", False):
+        for _, payload in calls:
+            transaction.on_commit(lambda payload=payload: func(**payload))
+        return []
+
+    run_at = now() + timedelta(seconds=delay)
+    jobs = [
+        Job(name=func.task_name, payload=payload, max_attempts=func.max_attempts,
+            run_at=run_at, idempotency_key=idempotency_key)
+        for idempotency_key, payload in calls
+    ]
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+    return jobs
+
+
+def backoff(attempts):
+    """Exponential backoff with jitter, in seconds, before retry ``attempts + 1``."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(limit, lease=LEASE_SECONDS):
+    """Mark up to ``limit`` due jobs as running and return them."""
+    from .models import Job
+
+    current = now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Job.QUEUED) | Q(status=Job.RUNNING, locked_until__lt=current),
+                run_at__lte=current,
+            )
+            .order_by("run_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        if ids:
+            Job.objects.filter(id__in=ids).update(
+                status=Job.RUNNING,
+                attempts=F("attempts") + 1,
+                locked_until=current + timedelta(seconds=lease),
+            )
+    return list(Job.objects.filter(id__in=ids))
+
+
+def run_job(job):
+    from .models import Job
+
+    try:
+        func = _registry[job.name]
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error("Job %s (%s) failed permanently:\n%s", job.id, job.name, error)
+            changes = {"status": Job.FAILED}
+        else:
+            retry_in = backoff(job.attempts)
+            logger.warning("Job %s (%s) failed, retrying in %.0fs:\n%s", job.id, job.name, retry_in, error)
+            changes = {"status": Job.QUEUED, "run_at": now() + timedelta(seconds=retry_in)}
+        Job.objects.filter(id=job.id).update(last_error=error, locked_until=None, **changes)
+    else:
+        Job.objects.filter(id=job.id).update(status=Job.DONE, last_error="", locked_until=None)
+
+
+def prune(done_before, failed_before=None, batch_size=1000):
+    """
+    Delete finished jobs last touched before ``done_before`` and failed jobs
+    last touched before ``failed_before`` (default: the same moment), a batch
+    at a time so the job table is never locked for long. Returns the number
+    deleted.
+
+    A pruned job's idempotency key can be queued again, so keep finished
+    jobs longer than any caller may retry the write that queued them.
+    """
+    from .models import Job
+
+    failed_before = failed_before or done_before
+    finished = Q(status=Job.DONE, updated_at__lt=done_before) | Q(status=Job.FAILED, updated_at__lt=failed_before)
+    deleted = 0
+    while True:
+        ids = list(Job.objects.filter(finished).values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Job.objects.filter(id__in=ids).delete()[0]
+
+
+def _run_in_thread(job):
+    try:
+        run_job(job)
+    finally:
+        # Pool threads each hold their own connection
+        connection.close()
+
+
+class Worker:
+    """Poll the job table and run due jobs on a thread pool."""
+
+    def __init__(self, threads=4, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stopped = False
+
+    def run_once(self):
+        """Run every job that is due right now; return how many ran."""
+        if self.threads <= 1:
+            return self._drain(lambda jobs: [run_job(job) for job in jobs])
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return self._drain(lambda jobs: list(pool.map(_run_in_thread, jobs)))
+
+    def _drain(self, run):
+        ran = 0
+        while True:
+            jobs = claim(max(1, self.threads))
+            if not jobs:
+                return ran
+            run(jobs)
+            ran += len(jobs)
+
+    def run_forever(self):
+        while not self.stopped:
+            if not self.run_once():
+                time.sleep(self.poll_interval)
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .catalog import bump_catalog_version
+
+
+def record_rating_change(previous, current):
+    """
+    Move one review's rating between item aggregates.
+
+    ``previous`` and ``current`` are ``(item_id, rating)`` pairs, or None when
+    the review is being created or deleted. Unrated reviews don't count.
+    """
+    from .models import Item
+
+    if previous == current:
+        return
+    deltas = defaultdict(lambda: [0, 0])
+    for state, sign in ((previous, -1), (current, 1)):
+        if state is None or state[0] is None or state[1] is None:
+            continue
+        item_id, rating = state
+        deltas[item_id][0] += sign * rating
+        deltas[item_id][1] += sign
+
+    # Review's own post_save/post_delete bump the catalog version
+    for item_id, (rating_sum, rating_count) in deltas.items():
+        if rating_sum or rating_count:
+            Item.objects.filter(pk=item_id).update(
+                rating_sum=F("rating_sum") + rating_sum,
+                rating_count=F("rating_count") + rating_count,
+            )
+
+
+def rebuild_item_ratings():
+    """Recompute every item's rating aggregates from its reviews in one UPDATE."""
+    from .models import Item, Review
+
+    reviews = (
+        Review.objects.filter(item=OuterRef("pk"), rating__isnull=False)
+        .order_by()
+        .values("item")
+    )
+    updated = Item.objects.update(
+        rating_sum=Coalesce(
+            Subquery(reviews.annotate(total=Sum("rating")).values("total")),
+            Value(0),
+            output_field=IntegerField(),
+        ),
+        rating_count=Coalesce(
+            Subquery(reviews.annotate(total=Count("id")).values("total")),
+            Value(0),
+            output_field=IntegerField(),
+        ),
+    )
+    transaction.on_commit(bump_catalog_version)
+    return updated
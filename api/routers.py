@@ -0,0 +1,156 @@
+"""
+Send read-only report and catalog traffic to a read replica.
+
+Views opt in with ``replica_reads = True``; ReplicaRoutingMiddleware then
+routes that request's reads to ``settings.DATABASE_REPLICA``. Everything
+else, every write and every read inside a transaction stays on the primary.
+A client that has just written is pinned to the primary for
+``REPLICA_STICKY_SECONDS`` so it reads its own writes despite replica lag.
+Shared caches rebuilt during such a request read from the primary
+(``primary_reads``), so a lagging replica never caches old rows under a
+new catalog version. Streamed response bodies keep reading from the
+replica while they are iterated, after the view has returned.
+"""
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_use_replica = ContextVar("use_replica", default=False)
+
+STICKY_KEY = "replica:pin:{client}"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def replica_alias():
+    return getattr(settings, "DATABASE_REPLICA", None)
+
+
+@contextmanager
+def _reads_from(replica):
+    token = _use_replica.set(replica)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_reads():
+    """Route reads in this block to the replica (when one is configured)."""
+    return _reads_from(True)
+
+
+def primary_reads():
+    """Route reads in this block to the primary, even in a replica-read request."""
+    return _reads_from(False)
+
+
+def _stream_from_replica(content):
+    # Set around each chunk rather than across yields: the server may pull
+    # chunks from another context than the one the view ran in
+    chunks = iter(content)
+    while True:
+        with replica_reads():
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def _astream_from_replica(content):
+    chunks = aiter(content)
+    while True:
+        with replica_reads():
+            chunk = await anext(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if not alias or not _use_replica.get():
+            return None
+        # Reads inside a transaction must see that transaction's writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+
+def client_key(request):
+    """Identify the client across requests without touching the database."""
+    credential = request.META.get("HTTP_AUTHORIZATION") or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return hashlib.sha1(credential.encode()).hexdigest()
+
+
+def pin_to_primary(request):
+    client = client_key(request)
+    if client:
+        cache.set(STICKY_KEY.format(client=client), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def pinned_to_primary(request):
+    client = client_key(request)
+    return bool(client) and cache.get(STICKY_KEY.format(client=client), False)
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        response = self.get_response(request)
+        if self._route_response(request, response):
+            pin_to_primary(request)
+        return response
+
+    async def _acall(self, request):
+        response = await self.get_response(request)
+        if self._route_response(request, response):
+            await sync_to_async(pin_to_primary)(request)
+        return response
+
+    def _route_response(self, request, response):
+        """Finish the request's replica routing; True when the client should be pinned."""
+        if getattr(request, "_replica_reads", False):
+            # Not a token reset: under ASGI process_view runs in a worker
+            # thread, whose context the token would belong to
+            _use_replica.set(False)
+            if response.streaming:
+                stream = _astream_from_replica if response.is_async else _stream_from_replica
+                response.streaming_content = stream(response.streaming_content)
+            return False
+        return request.method not in SAFE_METHODS and response.status_code < 400
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, "view_class", view_func)
+        if (
+            replica_alias()
+            and request.method in SAFE_METHODS
+            and getattr(view, "replica_reads", False)
+            and not pinned_to_primary(request)
+        ):
+            request._replica_reads = True
+            _use_replica.set(True)
+        return None
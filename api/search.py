@@ -0,0 +1,181 @@
+"""
+Ranked full-text and prefix search over the item catalog.
+
+On Postgres the query runs in the database against a weighted tsvector
+(name > category > description) with a GIN index, plus pg_trgm similarity
+on the name so typos still match. The indexes are created by the
+post_migrate hook in api.models. Elsewhere (SQLite in development and
+tests) an in-process inverted index is built from the catalog and rebuilt
+whenever the catalog version changes.
+
+The last search term always matches as a prefix, so the same endpoint
+serves autocomplete as the user types.
+"""
+import bisect
+import re
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .catalog import catalog_version
+from .routers import primary_reads
+
+MAX_QUERY_LENGTH = 100
+MAX_TERMS = 8
+
+# Must stay identical to the indexed expression or Postgres won't use the index
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+SEARCH_INDEXES_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS item_search_vector ON api_item USING GIN (({SEARCH_VECTOR_SQL}))",
+    "CREATE INDEX IF NOT EXISTS item_name_trigram ON api_item USING GIN (name gin_trgm_ops)",
+]
+
+# Field weights of the in-process index, mirroring the A/B/C weights above
+FIELD_WEIGHTS = {"name": 1.0, "category": 0.4, "description": 0.2}
+
+
+def terms(query):
+    return re.findall(r"\w+", (query or "")[:MAX_QUERY_LENGTH].lower())[:MAX_TERMS]
+
+
+def create_search_indexes(using=DEFAULT_DB_ALIAS):
+    """Create the full-text and trigram indexes (Postgres only)."""
+    if connections[using].vendor != "postgresql":
+        return
+    with connections[using].cursor() as cursor:
+        for statement in SEARCH_INDEXES_SQL:
+            cursor.execute(statement)
+
+
+class CatalogIndex:
+    """Inverted index of item text with the columns search filters on."""
+
+    def __init__(self, rows):
+        self.postings = {}
+        self.attributes = {}
+        for item_id, name, category, description, available, price in rows:
+            self.attributes[item_id] = (available, price)
+            for field, text in (("name", name), ("category", category), ("description", description)):
+                for term in terms(text):
+                    postings = self.postings.setdefault(term, {})
+                    postings[item_id] = max(postings.get(item_id, 0), FIELD_WEIGHTS[field])
+        self.vocabulary = sorted(self.postings)
+
+    @classmethod
+    def build(cls):
+        from .models import Item
+
+        return cls(Item.objects.values_list("id", "name", "category", "description", "available", "selling_price"))
+
+    def matches(self, term, prefix):
+        """``{item_id: weight}`` for ``term``, or for every word it starts when ``prefix``."""
+        if not prefix:
+            return self.postings.get(term, {})
+        found = {}
+        start = bisect.bisect_left(self.vocabulary, term)
+        for word in self.vocabulary[start:]:
+            if not word.startswith(term):
+                break
+            for item_id, weight in self.postings[word].items():
+                # An exact word outranks a longer word it merely starts
+                weight *= 1.0 if word == term else 0.8
+                found[item_id] = max(found.get(item_id, 0), weight)
+        return found
+
+    def search(self, query_terms, available=None, min_price=None, max_price=None, limit=20):
+        """Return up to ``limit`` ``(item_id, score)`` pairs, best first."""
+        scores = None
+        for position, term in enumerate(query_terms):
+            found = self.matches(term, prefix=position == len(query_terms) - 1)
+            if scores is None:
+                scores = dict(found)
+            else:
+                scores = {item_id: score + found[item_id] for item_id, score in scores.items() if item_id in found}
+            if not scores:
+                return []
+
+        results = []
+        for item_id, score in scores.items():
+            is_available, price = self.attributes[item_id]
+            if available is not None and bool(is_available) != available:
+                continue
+            if min_price is not None and (price is None or price < min_price):
+                continue
+            if max_price is not None and (price is None or price > max_price):
+                continue
+            results.append((item_id, score))
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit]
+
+
+_index_lock = threading.Lock()
+_index = (None, None)  # (catalog version, CatalogIndex)
+
+
+def catalog_index():
+    """The in-process index for the current catalog version."""
+    global _index
+    version = catalog_version()
+    built_for, index = _index
+    if built_for != version:
+        with _index_lock:
+            built_for, index = _index
+            if built_for != version:
+                with primary_reads():
+                    index = CatalogIndex.build()
+                _index = (version, index)
+    return index
+
+
+def _filtered(queryset, available, min_price, max_price):
+    if available is not None:
+        queryset = queryset.filter(available=available)
+    if min_price is not None:
+        queryset = queryset.filter(selling_price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(selling_price__lte=max_price)
+    return queryset
+
+
+def search_items(queryset, query, available=None, min_price=None, max_price=None, limit=20):
+    """
+    Return the best ``limit`` items of ``queryset`` matching ``query``.
+
+    Each returned item carries its relevance as ``search_rank``.
+    """
+    query_terms = terms(query)
+    if not query_terms:
+        return []
+
+    if connection.vendor == "postgresql":
+        tsquery = " & ".join(query_terms) + ":*"
+        text = " ".join(query_terms)
+        matched = RawSQL(
+            f"({SEARCH_VECTOR_SQL}) @@ to_tsquery('english', %s) OR name %% %s",
+            [tsquery, text],
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f"ts_rank({SEARCH_VECTOR_SQL}, to_tsquery('english', %s)) + similarity(name, %s)",
+            [tsquery, text],
+            output_field=FloatField(),
+        )
+        queryset = _filtered(queryset, available, min_price, max_price)
+        return list(queryset.filter(matched).annotate(search_rank=rank).order_by("-search_rank", "id")[:limit])
+
+    ranked = catalog_index().search(query_terms, available, min_price, max_price, limit)
+    items = queryset.in_bulk([item_id for item_id, _ in ranked])
+    results = []
+    for item_id, score in ranked:
+        item = items.get(item_id)
+        if item is not None:
+            item.search_rank = round(score, 3)
+            results.append(item)
+    return results
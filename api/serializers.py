@@ -1,8 +1,20 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.contrib.auth.models import Group
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from .models import *
+from .cart import apply_cart_changes, cart_for
+from .analytics import DAY, GRANULARITIES, MAX_HOURLY_DAYS, REPORT_DAYS
+from .checkout import checkout
+from .dispatch import couriers
+from .groups import user_groups
+from .images import image_srcset
+from .metrics import TimedSerializerMixin
+from .transitions import MAX_BATCH, TRANSITIONS, transition_orders
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
@@ -44,7 +56,8 @@ class LoginSerializer(serializers.Serializer):
         if mobile_number and password:
             try:
                 # Find user by mobile number
-                user = CustomUser.objects.get(mobile_number=mobile_number)
+                # The token rides along in the same query; see LoginView
+                user = CustomUser.objects.select_related('auth_token').get(mobile_number=mobile_number)
                 # Check if password matches
                 if not user.check_password(password):
                     raise serializers.ValidationError("Invalid mobile number or password.")
@@ -57,7 +70,12 @@ class LoginSerializer(serializers.Serializer):
         return data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    groups = serializers.SerializerMethodField()
+
+    def get_groups(self, user):
+        # Group ids from the prefetch or the membership cache, not a query per user
+        return [group_id for group_id, name in user_groups(user)]
 
     class Meta:
         model = CustomUser
@@ -65,15 +83,47 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    average_rating = serializers.FloatField(read_only=True)
+    image_srcset = serializers.SerializerMethodField()
+
+    # Model columns behind fields that aren't columns themselves
+    source_columns = {
+        'average_rating': ['rating_sum', 'rating_count', 'ratings'],
+        'image_srcset': ['image_variants'],
+    }
+
+    def get_image_srcset(self, item):
+        # {"webp": "<url> 160w, <url> 480w, ...", "jpeg": ...}, or None without variants
+        return image_srcset(item.image_variants)
+
+    def __init__(self, *args, **kwargs):
+        # Optional projection, e.g. ItemSerializer(items, fields=['id', 'name'])
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def project(cls, queryset, fields):
+        """Defer every column the projected representation does not read."""
+        if fields is None:
+            return queryset
+        columns = []
+        for name in fields:
+            columns.extend(cls.source_columns.get(name, [name]))
+        return queryset.only(*columns)
+
     class Meta:
         model = Item
         fields = [
              'id','name', 'description', 'mrp_price', 'selling_price', 
-            'offer_percentage', 'ratings', 'category', 'image','available'
+            'offer_percentage', 'ratings', 'average_rating', 'rating_count', 'category', 'image', 'image_srcset','available'
         ]
+        read_only_fields = ['rating_count']
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     dish_name = serializers.CharField(source='dish.name', read_only=True)
     dish_price = serializers.DecimalField(source='dish.selling_price', max_digits=10, decimal_places=2, read_only=True)
     dish_image = serializers.ImageField(source='dish.image', read_only=True)
@@ -84,7 +134,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'dish', 'dish_name','dish_image', 'dish_price', 'quantity', 'total_price']
         
 
-class AddtoCartSerializer(serializers.ModelSerializer):
+class AddtoCartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     dish_name = serializers.CharField(source='dish.name', read_only=True)
     dish_price = serializers.DecimalField(source='dish.selling_price', max_digits=10, decimal_places=2, read_only=True)
     dish_image = serializers.ImageField(source='dish.image', read_only=True)
@@ -112,49 +162,91 @@ class BulkPurchaseSerializer(serializers.Serializer):
             raise serializers.ValidationError("No cart items provided for purchase.")
         return value
 
+    def create(self, validated_data):
+        return checkout(self.context['request'].user, validated_data['cart_items'])
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100)
+    available = serializers.BooleanField(required=False, allow_null=True, default=None)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=Decimal("0"))
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=Decimal("0"))
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    # Whole local days; ``end`` is inclusive
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default=DAY)
+    status = serializers.MultipleChoiceField(choices=list(TRANSITIONS), required=False)
+    top = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+    def validate(self, data):
+        data.setdefault('end', timezone.localdate())
+        data.setdefault('start', data['end'] - timedelta(days=REPORT_DAYS - 1))
+        if data['start'] > data['end']:
+            raise ValidationError("start must not be after end.")
+        if data['granularity'] != DAY and (data['end'] - data['start']).days >= MAX_HOURLY_DAYS:
+            raise ValidationError(f"Hourly reports cover at most {MAX_HOURLY_DAYS} days.")
+        return data
+
+
+class CartLineSerializer(serializers.Serializer):
+    dish = serializers.IntegerField(required=True)
+    quantity = serializers.IntegerField(required=True, min_value=0)  # 0 removes the dish
+
+
+class CartBatchSerializer(serializers.Serializer):
+    items = serializers.ListField(
+        child=CartLineSerializer(),
+        allow_empty=False,
+        max_length=100,
+        error_messages={'required': 'Cart items are required.'}
+    )
+
     def create(self, validated_data):
         user = self.context['request'].user
-     
-        order = Order.objects.create(user=user)
-        purchases = []
-        
-        for cart_item_data in validated_data['cart_items']:
-
-            print(cart_item_data['id'],"cart_item_data['id']")
-            # Fetch the CartItem
-            cart_item = CartItem.objects.filter(id=cart_item_data['id'], user=user).first()
-         
-            if not cart_item:
-                raise serializers.ValidationError(
-                    f"Cart item with ID {cart_item_data['id']} not found or doesn't belong to the user."
-                )
-            
- 
-            
-            # Create purchase entry
-            purchase = ItemPurchase.objects.create(
-                user = user,
-                order=order,
-                item=cart_item.dish,
-                quantity=cart_item_data['quantity'],
-                total_price=cart_item.dish.selling_price * cart_item_data['quantity'],
-            )
-            purchases.append(purchase)
-
-            # Optionally delete cart items after purchase
-            cart_item.delete()
-
-        # Update order total price
-        order.update_total_price()
-
-        return order
-
-
-class ItemPurchaseSerializer(serializers.ModelSerializer):
-    dish_name = serializers.CharField(source='item.name', read_only=True)  # Dish name from the related Item model
-    dish_image = serializers.ImageField(source='item.image', read_only=True)  # Dish image from the related Item model
-    dish_category = serializers.CharField(source='item.category', read_only=True)  # Dish image from the related Item model
-    dish_ratings = serializers.IntegerField(source='item.ratings', read_only=True)  # Dish ratings from related Item model
+        apply_cart_changes(user, validated_data['items'])
+        return cart_for(user)
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    unique_ids = serializers.ListField(
+        child=serializers.CharField(max_length=20),
+        allow_empty=False,
+        max_length=MAX_BATCH,
+        error_messages={'required': 'Order ids are required.'}
+    )
+    status = serializers.ChoiceField(choices=list(TRANSITIONS))
+    delivery_partner_email = serializers.EmailField(required=False)
+
+    def validate_delivery_partner_email(self, value):
+        # Only members of the delivery partner group can be assigned
+        delivery_person = couriers().filter(email=value).first()
+        if delivery_person is None:
+            raise ValidationError("Delivery partner not found.")
+        return delivery_person
+
+    def validate(self, data):
+        # Only shipping assigns a courier; don't silently reassign on other moves
+        if 'delivery_partner_email' in data and data['status'] != "Shipped":
+            raise ValidationError({'delivery_partner_email': "A delivery partner can only be given when shipping."})
+        return data
+
+    def create(self, validated_data):
+        return transition_orders(
+            validated_data['unique_ids'],
+            validated_data['status'],
+            validated_data.get('delivery_partner_email'),
+        )
+
+
+class ItemPurchaseSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Read from the line's snapshot of the dish, so order history never joins Item
+    dish_name = serializers.CharField(source='item_name', read_only=True)
+    dish_image = serializers.ImageField(source='item_image', read_only=True)
+    dish_category = serializers.CharField(source='item_category', read_only=True)
+    dish_ratings = serializers.FloatField(source='item_rating', read_only=True)  # Dish rating when it was purchased
 
     class Meta:
         model = ItemPurchase
@@ -162,7 +254,7 @@ class ItemPurchaseSerializer(serializers.ModelSerializer):
         depth = 1
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     purchases = ItemPurchaseSerializer(many=True, read_only=True)  # Include related ItemPurchase objects
 
     class Meta:
@@ -170,7 +262,7 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['unique_id', 'total_price', 'status',  'order_at',"shipping_time","delivery_time", 'purchases']
 
 
-class AdminOrderSerializer(serializers.ModelSerializer):
+class AdminOrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     purchases = ItemPurchaseSerializer(many=True, read_only=True)  # Include related ItemPurchase objects
     user =UserSerializer(read_only=True)
     delivery_person = UserSerializer(read_only=True)
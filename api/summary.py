@@ -0,0 +1,95 @@
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+# Seconds a worker may serve its own copy of the summary before re-reading it
+SUMMARY_CACHE_TTL = getattr(settings, "ORDER_SUMMARY_CACHE_TTL", 5)
+
+_cache = {"value": None, "expires": 0.0}
+
+
+def invalidate_summary_cache():
+    _cache["value"] = None
+
+
+def _apply_deltas(deltas):
+    from .models import OrderStatusSummary
+
+    for order_status, (count, revenue) in deltas.items():
+        if not count and not revenue:
+            continue
+        changes = {"count": F("count") + count, "revenue": F("revenue") + revenue}
+        if not OrderStatusSummary.objects.filter(status=order_status).update(**changes):
+            OrderStatusSummary.objects.bulk_create(
+                [OrderStatusSummary(status=order_status)], ignore_conflicts=True
+            )
+            OrderStatusSummary.objects.filter(status=order_status).update(**changes)
+    transaction.on_commit(invalidate_summary_cache)
+
+
+def record_order_change(previous, current):
+    """
+    Move one order's contribution between status rows.
+
+    ``previous`` and ``current`` are ``(status, total_price)`` pairs, or None
+    when the order is being created or deleted. Call inside the transaction
+    that writes the order.
+    """
+    record_order_changes([(previous, current)])
+
+
+def record_order_changes(changes):
+    """Apply many ``(previous, current)`` pairs with one UPDATE per status."""
+    deltas = defaultdict(lambda: [0, Decimal("0")])
+    for previous, current in changes:
+        if previous == current:
+            continue
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is None or not state[0]:
+                continue
+            order_status, total_price = state
+            deltas[order_status][0] += sign
+            deltas[order_status][1] += sign * Decimal(total_price or 0)
+    if deltas:
+        _apply_deltas(deltas)
+
+
+def order_summary():
+    """Return ``{"status_counts": {...}, "total_revenue": Decimal}``."""
+    from .models import OrderStatusSummary
+
+    if _cache["value"] is not None and _cache["expires"] > time.monotonic():
+        return _cache["value"]
+
+    rows = list(OrderStatusSummary.objects.order_by("status").values_list("status", "count", "revenue"))
+    value = {
+        "status_counts": {row_status: count for row_status, count, _ in rows if count},
+        "total_revenue": sum((revenue for _, _, revenue in rows), Decimal("0")),
+    }
+    _cache["value"] = value
+    _cache["expires"] = time.monotonic() + SUMMARY_CACHE_TTL
+    return value
+
+
+def rebuild_order_summary():
+    """Recompute every status row from the orders table."""
+    from .models import Order, OrderStatusSummary
+
+    totals = (
+        Order.objects.exclude(status__isnull=True).exclude(status="")
+        .values("status")
+        .annotate(count=Count("id"), revenue=Sum("total_price"))
+        .order_by()
+    )
+    with transaction.atomic():
+        OrderStatusSummary.objects.all().delete()
+        OrderStatusSummary.objects.bulk_create(
+            OrderStatusSummary(status=row["status"], count=row["count"], revenue=row["revenue"] or 0)
+            for row in totals
+        )
+        transaction.on_commit(invalidate_summary_cache)
+    return list(totals)
@@ -0,0 +1,87 @@
+"""Jobs run by `manage.py runworker`, and helpers that queue them."""
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .analytics import ROLLUP_DELAY, hour_of, refresh_hours
+from .catalog import bump_catalog_version
+from .images import build_variants
+from .queue import enqueue, enqueue_many, task
+
+
+@task("image_variants")
+def generate_image_variants(model, pk, name):
+    model_class = apps.get_model(model)
+    variants = build_variants(name)
+    # Skip the write if the image was replaced while the job waited
+    updated = model_class.objects.filter(pk=pk, image=name).update(image_variants=variants)
+    if updated and model_class._meta.label == "api.Item":
+        bump_catalog_version()
+
+
+def queue_image_variants(instance):
+    label = instance._meta.label
+    # One job per upload: a photo swapped back in (A -> B -> A) needs rendering
+    # again even though a job for the same row and name already ran
+    enqueue(
+        generate_image_variants,
+        idempotency_key=f"image-variants:{label}:{instance.pk}:{instance.image.name}:{uuid4().hex}",
+        model=label,
+        pk=instance.pk,
+        name=instance.image.name,
+    )
+
+
+@task("order_status_email")
+def send_order_status_email(order_id, status):
+    order = apps.get_model("api.Order").objects.select_related("user").get(pk=order_id)
+    if not order.user or not order.user.email:
+        return
+    send_mail(
+        subject=f"Your order {order.unique_id} is {status.lower()}",
+        message=f"Hi {order.user.name or ''},\n\nYour order {order.unique_id} is now {status}.",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[order.user.email],
+    )
+
+
+def queue_status_notification(order):
+    enqueue(
+        send_order_status_email,
+        idempotency_key=f"order-status:{order.pk}:{order.status}",
+        order_id=order.pk,
+        status=order.status,
+    )
+
+
+def queue_status_notifications(orders):
+    enqueue_many(
+        send_order_status_email,
+        (
+            (f"order-status:{order.pk}:{order.status}", {"order_id": order.pk, "status": order.status})
+            for order in orders
+        ),
+    )
+
+
+@task("sales_rollups", max_attempts=3)
+def refresh_sales_rollups(hours):
+    refresh_hours(datetime.fromisoformat(hour) for hour in hours)
+
+
+def queue_sales_rollups(orders):
+    """Recompute the rollups of the hours ``orders`` were placed in, shortly after this commits."""
+    hours = sorted({hour_of(order.order_at).isoformat() for order in orders if order.order_at})
+    if not hours:
+        return
+    # Changes to one hour within the same delay window share a single job
+    window = int(time.time() // ROLLUP_DELAY)
+    enqueue_many(
+        refresh_sales_rollups,
+        ((f"sales-rollup:{hour}:{window}", {"hours": [hour]}) for hour in hours),
+        delay=ROLLUP_DELAY,
+    )
@@ -1,3 +1,1325 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import token_cache
+from .catalog import bump_catalog_version
+from .dispatch import courier_roster
+from .events import broker, order_event
+from .benchmarks.endpoints import SCENARIOS, load_baseline, run, seed
+from .ids import code_space, encode, order_sequence
+from .metrics import registry
+from .models import CartItem, CourierLoad, CustomUser, Item, ItemPurchase, Order, Job, OrderStatusSummary, Review, SalesRollup
+from .queue import Worker, enqueue, task
+from .ratings import rebuild_item_ratings
+from .routers import ReplicaRouter, ReplicaRoutingMiddleware, primary_reads, replica_reads
+from .serializers import ItemSerializer
+from .summary import invalidate_summary_cache, order_summary, rebuild_order_summary
+from .views import CartView, DashboardView, Dishes
+
+
+def create_user(email, mobile_number):
+    return CustomUser.objects.create_user(email=email, mobile_number=mobile_number, password="secret")
+
+
+class OrderQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_user("customer@example.com", "9000000001")
+        cls.courier = create_user("courier@example.com", "9000000002")
+        cls.items = [
+            Item.objects.create(name=f"Dish {i}", category="Meals", selling_price=100 + i)
+            for i in range(3)
+        ]
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.customer, delivery_person=self.courier)
+            for item in self.items:
+                ItemPurchase.objects.create(user=self.customer, order=order, item=item, quantity=2)
+
+    def assertConstantQueries(self, url, num):
+        courier_roster()
+        for count in (2, 10):
+            self.create_orders(count)
+            invalidate_summary_cache()
+            with self.assertNumQueries(num):
+                self.client.get(url)
+
+    def test_payment_view(self):
+        # orders with users, purchases, user groups, courier groups
+        self.assertConstantQueries(reverse("payments"), 4)
+
+    def test_new_orders(self):
+        self.assertConstantQueries(reverse("new_orders"), 2)
+
+    def test_dashboard(self):
+        # revenue summary, orders, purchases
+        self.assertConstantQueries(reverse("dashboard"), 3)
+
+    def test_orders_view(self):
+        # status counts, orders, purchases; the courier roster is cached
+        self.assertConstantQueries(reverse("orders"), 3)
+
+    def test_order_status_view(self):
+        self.create_orders(2)
+        with self.assertNumQueries(2):
+            self.client.post(reverse("orders-status", args=["Pending"]))
+        self.create_orders(10)
+        with self.assertNumQueries(2):
+            self.client.post(reverse("orders-status", args=["Pending"]))
+
+
+class OrderSummaryTests(TestCase):
+    def setUp(self):
+        invalidate_summary_cache()
+        self.customer = create_user("customer@example.com", "9000000001")
+
+    def summary(self):
+        invalidate_summary_cache()
+        return order_summary()
+
+    def test_counters_follow_status_changes(self):
+        first = Order.objects.create(user=self.customer, total_price=100)
+        Order.objects.create(user=self.customer, total_price=50)
+        first.update_status("Shipped")
+        first.total_price = 120
+        first.save()
+
+        summary = self.summary()
+        self.assertEqual(summary["status_counts"], {"Pending": 1, "Shipped": 1})
+        self.assertEqual(summary["total_revenue"], 170)
+
+        Order.objects.get(pk=first.pk).delete()
+        summary = self.summary()
+        self.assertEqual(summary["status_counts"], {"Pending": 1})
+        self.assertEqual(summary["total_revenue"], 50)
+
+    def test_rebuild_matches_incremental_counters(self):
+        for total in (10, 20, 30):
+            Order.objects.create(user=self.customer, total_price=total).update_status("Delivered")
+        expected = self.summary()
+        OrderStatusSummary.objects.all().delete()
+        rebuild_order_summary()
+        self.assertEqual(self.summary(), expected)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.customer = create_user("customer@example.com", "9000000001")
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.cart = [
+            CartItem.objects.create(
+                user=self.customer,
+                dish=Item.objects.create(name=f"Dish {i}", selling_price=10 * (i + 1)),
+            )
+            for i in range(5)
+        ]
+
+    def purchase(self, lines):
+        return self.client.post(reverse("purchase-cart-items"), {"cart_items": lines}, format="json")
+
+    def test_checkout_cost_does_not_grow_with_basket(self):
+        # Start a fresh order code block and create the Pending counter row
+        order_sequence.reset()
+        Order.objects.create(user=self.customer).delete()
+        query_counts = []
+        for basket in (self.cart[:1], self.cart[1:]):
+            lines = [{"id": cart_item.id, "quantity": 2} for cart_item in basket]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.purchase(lines)
+            self.assertEqual(response.status_code, 201)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(sorted(Order.objects.values_list("total_price", flat=True)), [20, 280])
+        self.assertEqual(ItemPurchase.objects.count(), 5)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_bad_line_leaves_nothing_behind(self):
+        lines = [{"id": self.cart[0].id, "quantity": 1}, {"id": 999, "quantity": 1}]
+        response = self.purchase(lines)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 5)
+
+    def test_order_history_keeps_the_purchased_dish(self):
+        dish = self.cart[0].dish
+        self.purchase([{"id": self.cart[0].id, "quantity": 3}])
+        dish.name = "Renamed"
+        dish.selling_price = 99
+        dish.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("user-orders"))
+        self.assertFalse([query for query in queries if '"api_item"' in query["sql"]])
+        line = response.data[0]["purchases"][0]
+        self.assertEqual((line["dish_name"], line["quantity"], line["total_price"]), ("Dish 0", 3, "30.00"))
+
+        dish.delete()
+        purchase = ItemPurchase.objects.get()
+        self.assertEqual((purchase.item, purchase.item_name, purchase.unit_price), (None, "Dish 0", 10))
+
+    def test_backfill_fills_lines_saved_before_snapshots(self):
+        self.purchase([{"id": cart_item.id, "quantity": 2} for cart_item in self.cart])
+        # Legacy rows: no snapshot, paid less than today's price
+        ItemPurchase.objects.update(item_name=None, item_category=None, unit_price=None, total_price=2)
+        out = io.StringIO()
+        call_command("backfill_purchase_snapshots", "--batch-size=2", stdout=out)
+        self.assertIn("Backfilled 5 purchases", out.getvalue())
+        self.assertEqual(
+            sorted(ItemPurchase.objects.values_list("item_name", "unit_price")),
+            [(f"Dish {i}", 1) for i in range(5)],
+        )
+        call_command("backfill_purchase_snapshots", stdout=out)
+        self.assertIn("Backfilled 0 purchases", out.getvalue())
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = create_user("customer@example.com", "9000000001")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.items = [Item.objects.create(name=f"Dish {n}", category="Meals", selling_price=10 * (n + 1)) for n in range(5)]
+
+    def batch(self, *lines):
+        return self.client.post(
+            reverse("cart-batch"),
+            {"items": [{"dish": item.id, "quantity": quantity} for item, quantity in lines]},
+            format="json",
+        )
+
+    def test_batch_upserts_and_removes(self):
+        first, second, third = self.items[:3]
+        CartItem.objects.create(user=self.user, dish=first, quantity=1)
+        CartItem.objects.create(user=self.user, dish=third, quantity=1)
+
+        response = self.batch((first, 3), (second, 2), (third, 0))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row["dish"], row["quantity"], row["total_price"]) for row in response.data],
+            [(first.id, 3, "30.00"), (second.id, 2, "40.00")],
+        )
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        with CaptureQueriesContext(connection) as single:
+            self.batch((self.items[0], 1))
+        with CaptureQueriesContext(connection) as many:
+            self.batch(*((item, 2) for item in self.items))
+        self.assertEqual(len(single), len(many))
+
+    def test_unknown_dish_changes_nothing(self):
+        response = self.client.post(
+            reverse("cart-batch"),
+            {"items": [{"dish": self.items[0].id, "quantity": 1}, {"dish": 0, "quantity": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_repeated_taps_keep_one_row(self):
+        for quantity in (1, 2, 3):
+            response = self.client.post(reverse("cart"), {"dish": self.items[0].id, "quantity": quantity})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(CartItem.objects.values_list("quantity", flat=True)), [3])
+        self.assertEqual(response.data["dish_name"], "Dish 0")
+
+
+@override_settings(DATABASE_REPLICA="replica", REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def test_reads_use_the_replica_only_when_asked(self):
+        self.assertIsNone(self.router.db_for_read(Item))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Item), "replica")
+            self.assertEqual(self.router.db_for_write(Item), "default")
+        self.assertIsNone(self.router.db_for_read(Item))
+
+    def test_no_replica_configured(self):
+        with override_settings(DATABASE_REPLICA=None), replica_reads():
+            self.assertIsNone(self.router.db_for_read(Item))
+
+    def route(self, request, view):
+        seen = []
+
+        def get_response(request):
+            seen.append(self.router.db_for_read(Item))
+            return HttpResponse(status=201 if request.method == "POST" else 200)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        middleware.process_view(request, view, (), {})
+        middleware(request)
+        return seen[0]
+
+    def test_only_marked_views_read_from_the_replica(self):
+        self.assertEqual(self.route(self.factory.get("/dishes/"), Dishes.as_view()), "replica")
+        self.assertIsNone(self.route(self.factory.get("/cart/"), CartView.as_view()))
+        self.assertIsNone(self.router.db_for_read(Item))
+
+    def test_cache_rebuilds_and_streamed_bodies(self):
+        with replica_reads():
+            with primary_reads():
+                self.assertIsNone(self.router.db_for_read(Item))
+            self.assertEqual(self.router.db_for_read(Item), "replica")
+
+        def get_response(request):
+            return StreamingHttpResponse(str(self.router.db_for_read(Item)) for _ in range(2))
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        request = self.factory.get("/payments/?export=csv")
+        middleware.process_view(request, Dishes.as_view(), (), {})
+        response = middleware(request)
+        self.assertIsNone(self.router.db_for_read(Item))
+        # The body is read after the middleware returned
+        self.assertEqual(b"".join(response.streaming_content), b"replicareplica")
+        self.assertIsNone(self.router.db_for_read(Item))
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        headers = {"HTTP_AUTHORIZATION": "Token abc"}
+        self.route(self.factory.post("/cart/", **headers), CartView.as_view())
+        self.assertIsNone(self.route(self.factory.get("/dashboard/", **headers), DashboardView.as_view()))
+        other = {"HTTP_AUTHORIZATION": "Token xyz"}
+        self.assertEqual(self.route(self.factory.get("/dashboard/", **other), DashboardView.as_view()), "replica")
+
+
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.client = APIClient()
+        Item.objects.create(name="Dish", category="Meals", selling_price=100)
+
+    def test_server_timing_reports_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("category_dishes", args=["Meals"]))
+        timing = response["Server-Timing"]
+        self.assertIn("app;dur=", timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn("render;dur=", timing)
+
+    def test_serializer_data_is_timed_separately_from_rendering(self):
+        to_representation = ItemSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.02)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(ItemSerializer, "to_representation", slow):
+            response = self.client.get(reverse("category_dishes", args=["Meals"]))
+        timings = dict(entry.strip().split(";dur=") for entry in response["Server-Timing"].split(","))
+        self.assertGreaterEqual(float(timings["serialize"]), 20)
+        self.assertLess(float(timings["render"]), 20)
+        self.assertIn('http_request_serialize_duration_seconds_count{method="GET",route="dishes/<str:category>"} 1',
+                      registry.render())
+
+    def test_metrics_endpoint_is_staff_only(self):
+        user = create_user("customer@example.com", "9000000001")
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        self.client.get(reverse("category_dishes", args=["Meals"]))
+        self.client.get(reverse("category_dishes", args=["Meals"]))
+        user.is_staff = True
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="dishes/<str:category>"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{method="GET",route="dishes/<str:category>",le="+Inf"} 2', body)
+
+class PaymentExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        customer = create_user("customer@example.com", "9000000001")
+        dish = Item.objects.create(name="Biryani", category="Meals", selling_price=100)
+        self.orders = []
+        for day, quantity in ((1, 1), (2, 2), (3, 3)):
+            order = Order.objects.create(user=customer, total_price=100 * quantity)
+            ItemPurchase.objects.create(user=customer, order=order, item=dish, quantity=quantity)
+            Order.objects.filter(pk=order.pk).update(order_at=datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc))
+            self.orders.append(order)
+
+    def ids(self, **params):
+        response = self.client.get(reverse("payments"), params)
+        self.assertEqual(response.status_code, 200)
+        return [row["unique_id"] for row in response.data]
+
+    def test_from_and_to_bounds(self):
+        first, second, third = (order.unique_id for order in self.orders)
+        self.assertEqual(self.ids(**{"from": "2024-03-02"}), [third, second])
+        # A bare end date includes that whole day
+        self.assertEqual(self.ids(to="2024-03-02"), [second, first])
+        self.assertEqual(self.ids(**{"from": "2024-03-02T12:00:00Z", "to": "2024-03-02T12:00:00Z"}), [second])
+        for params in ({"from": "2024-02-30"}, {"to": "2024-03-02T25:00"}, {"from": "yesterday"}):
+            response = self.client.get(reverse("payments"), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params)), response.data)
+
+    def test_ndjson_export(self):
+        response = self.client.get(reverse("payments"), {"export": "ndjson", "from": "2024-03-02"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["unique_id"] for row in rows], [order.unique_id for order in self.orders[1:]])
+        self.assertEqual(rows[0]["purchases"][0]["quantity"], 2)
+
+    def test_csv_export(self):
+        response = self.client.get(reverse("payments"), {"export": "csv", "to": "2024-03-01"})
+        self.assertIn("attachment", response["Content-Disposition"])
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ["unique_id", "order_at", "status"])
+        self.assertEqual(len(rows), 2)
+        row = dict(zip(rows[0], rows[1]))
+        self.assertEqual(row["unique_id"], self.orders[0].unique_id)
+        self.assertEqual((row["total_price"], row["customer_email"], row["items"]), ("100.00", "customer@example.com", "Biryani x1"))
+        self.assertEqual(self.client.get(reverse("payments"), {"export": "xml"}).status_code, 400)
+
+
+class OrderCodeTests(TestCase):
+    def test_codes_are_a_bijection_of_the_sequence(self):
+        codes = {encode(value, length=3) for value in range(code_space(3))}
+        self.assertEqual(len(codes), code_space(3))
+        self.assertTrue(all(len(code) == 3 for code in codes))
+
+    def test_collision_with_legacy_code_retries(self):
+        customer = create_user("customer@example.com", "9000000001")
+        order_sequence.reset()
+        Order.objects.create(user=customer)
+        # A pre-allocator order already holds the code the sequence hands out next
+        legacy = encode(order_sequence.peek())
+        Order.objects.create(user=customer, unique_id=legacy)
+        order = Order.objects.create(user=customer)
+        self.assertNotEqual(order.unique_id, legacy)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_rolled_back_reservation_is_not_handed_out_again(self):
+        customer = create_user("customer@example.com", "9000000001")
+        order_sequence.reset()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Order.objects.create(user=customer)  # Reserves a fresh block
+                raise RuntimeError
+        codes = [Order.objects.create(user=customer).unique_id for _ in range(10)]
+        # Another worker (or this one after a restart) reserves the next block
+        order_sequence.reset()
+        codes += [Order.objects.create(user=customer).unique_id for _ in range(10)]
+        self.assertEqual(len(set(codes)), 20)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.customer = create_user("customer@example.com", "9000000001")
+        self.token = Token.objects.create(user=self.customer)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_repeat_requests_skip_the_token_lookup(self):
+        self.assertEqual(self.client.get(reverse("cart")).status_code, 200)
+        # Only the cart itself is read
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse("cart")).status_code, 200)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get(reverse("user"))
+        self.token.delete()
+        self.assertEqual(self.client.get(reverse("user")).status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(reverse("user"))
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get(reverse("user")).status_code, 401)
+
+    def test_changes_made_by_other_workers_are_seen_after_the_local_ttl(self):
+        self.client.get(reverse("user"))
+        # update() sends no signal, as if another process had made the change
+        CustomUser.objects.filter(pk=self.customer.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse("user")).status_code, 200)
+
+        later = time.monotonic() + token_cache.ttl + 1
+        with mock.patch("api.authentication.time.monotonic", return_value=later):
+            self.assertEqual(self.client.get(reverse("user")).status_code, 401)
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        self.customer = create_user("customer@example.com", "9000000001")
+        self.customer.groups.add(Group.objects.get_or_create(name="user")[0])
+
+    def login(self):
+        return self.client.post(reverse("login"), {"mobile_number": "9000000001", "password": "secret"})
+
+    def test_login_resolves_user_token_and_groups_in_two_queries(self):
+        Token.objects.create(user=self.customer)
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["groups"], "user")
+        # Group membership is cached after the first login
+        with self.assertNumQueries(1):
+            self.login()
+
+    def test_first_login_creates_one_token(self):
+        key = self.login().json()["tokens"]
+        self.assertEqual(self.login().json()["tokens"], key)
+        self.assertEqual(Token.objects.filter(user=self.customer).count(), 1)
+
+    @override_settings(
+        PASSWORD_HASHERS=["api.hashers.TunedPBKDF2PasswordHasher", "django.contrib.auth.hashers.PBKDF2PasswordHasher"],
+        PASSWORD_HASHER_ITERATIONS=1000,
+    )
+    def test_login_rehashes_to_the_tuned_profile(self):
+        self.customer.password = make_password("secret", hasher=PBKDF2PasswordHasher())
+        self.customer.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertTrue(self.customer.password.startswith("pbkdf2_sha256$1000$"))
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(name="Dish", category="Meals", selling_price=100, ratings=3)
+        self.other = Item.objects.create(name="Other", category="Meals", selling_price=100)
+
+    def test_reviews_maintain_item_aggregates(self):
+        self.assertEqual(self.item.average_rating, 3)
+        first = Review.objects.create(item=self.item, rating=4)
+        Review.objects.create(item=self.item, rating=5)
+        Review.objects.create(item=self.item, rating=None)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (9, 2))
+        self.assertEqual(self.item.average_rating, 4.5)
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 2
+        first.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.average_rating, 3.5)
+
+        first.item = self.other
+        first.save()
+        first.delete()
+        self.item.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (5, 1))
+        self.assertEqual((self.other.rating_sum, self.other.rating_count), (0, 0))
+
+    def test_saving_a_stale_item_keeps_new_reviews(self):
+        stale = Item.objects.get(pk=self.item.pk)
+        Review.objects.create(item=self.item, rating=4)
+        stale.selling_price = 120
+        stale.save()
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (4, 1))
+        self.assertEqual(self.item.selling_price, 120)
+
+    def test_rebuild_matches_incremental_aggregates(self):
+        for rating in (1, 2, 5):
+            Review.objects.create(item=self.item, rating=rating)
+        Item.objects.update(rating_sum=0, rating_count=0)
+        rebuild_item_ratings()
+        self.item.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.item.rating_sum, self.item.rating_count), (8, 3))
+        self.assertEqual((self.other.rating_sum, self.other.rating_count), (0, 0))
+
+
+
+class CatalogConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = Item.objects.create(name="Dish", category="Meals", selling_price=100)
+        self.client = APIClient()
+
+    def test_unchanged_catalog_answers_304_without_queries(self):
+        for url in (reverse("dishes"), reverse("shop"), reverse("new_dishes"),
+                    reverse("category_dishes", args=["Meals"]),
+                    reverse("product-details", args=[self.item.id])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("max-age", response["Cache-Control"])
+            with self.assertNumQueries(0):
+                cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached["ETag"], response["ETag"])
+
+    def test_catalog_writes_change_the_etag(self):
+        url = reverse("dishes")
+        etag = self.client.get(url)["ETag"]
+        self.assertNotEqual(self.client.get(url + "?limit=5")["ETag"], etag)
+
+        self.item.selling_price = 90
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(item=self.item, rating=4)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_every_bump_moves_last_modified_forward(self):
+        url = reverse("dishes")
+        with mock.patch("api.catalog.time.time", return_value=1_700_000_000.2):
+            bump_catalog_version()
+            last_modified = self.client.get(url)["Last-Modified"]
+            bump_catalog_version()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["Last-Modified"], last_modified)
+
+    def test_menu_is_invalidated_when_the_write_commits(self):
+        url = reverse("dishes")
+        self.assertEqual(self.client.get(url).data["categories"]["Meals"]["items"][0]["selling_price"], "100.00")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.item.selling_price = 90
+            self.item.save()
+            # Until the write commits, readers keep the cached menu
+            self.assertEqual(self.client.get(url).data["categories"]["Meals"]["items"][0]["selling_price"], "100.00")
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).data["categories"]["Meals"]["items"][0]["selling_price"], "90.00")
+
+    def test_menu_queries_do_not_grow_with_categories(self):
+        url = reverse("dishes")
+        with CaptureQueriesContext(connection) as one_category:
+            self.client.get(url)
+        self.assertGreater(len(one_category), 0)
+
+        for n in range(20):
+            Item.objects.create(name=f"Dish {n}", category=f"Category {n}", selling_price=50)
+        bump_catalog_version()
+        with self.assertNumQueries(len(one_category)):
+            response = self.client.get(url)
+        self.assertEqual(response.data["category_count"], 21)
+
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for name, category, price, available, description in (
+            ("Chicken Biryani", "Meals", 250, True, "Spicy rice"),
+            ("Chicken Wings", "Starters", 180, True, ""),
+            ("Paneer Tikka", "Starters", 200, True, "Grilled, goes well with chicken curry"),
+            ("Chocolate Cake", "Desserts", 120, False, ""),
+        ):
+            Item.objects.create(name=name, category=category, selling_price=price, available=available,
+                                description=description)
+
+    def search(self, **params):
+        response = self.client.get(reverse("search"), params)
+        self.assertEqual(response.status_code, 200)
+        return [row["name"] for row in response.data["results"]]
+
+    def test_ranks_name_matches_first(self):
+        names = self.search(q="chicken")
+        self.assertEqual(set(names[:2]), {"Chicken Biryani", "Chicken Wings"})
+        self.assertEqual(names[2], "Paneer Tikka")
+        self.assertEqual(self.search(q="chicken bir"), ["Chicken Biryani"])
+        self.assertEqual(self.search(q="starters tik"), ["Paneer Tikka"])
+
+    def test_last_term_autocompletes(self):
+        self.assertEqual(set(self.search(q="ch")), {"Chicken Biryani", "Chicken Wings", "Paneer Tikka", "Chocolate Cake"})
+        self.assertEqual(self.search(q="choc"), ["Chocolate Cake"])
+
+    def test_filters(self):
+        self.assertNotIn("Chocolate Cake", self.search(q="c", available="true"))
+        self.assertEqual(self.search(q="chicken", min_price="210", max_price="300"), ["Chicken Biryani"])
+        self.assertEqual(self.client.get(reverse("search"), {"q": "x", "min_price": "cheap"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("search")).status_code, 400)
+
+    def test_catalog_changes_are_searchable(self):
+        self.assertEqual(self.search(q="soup"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.create(name="Chicken Soup", category="Starters", selling_price=90)
+        self.assertEqual(self.search(q="soup"), ["Chicken Soup"])
+
+    def test_one_query_and_projection(self):
+        self.search(q="chicken")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("search"), {"q": "wings", "fields": "name"})
+        self.assertEqual(list(response.data["results"][0]), ["id", "name", "rank"])
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Item.objects.bulk_create(
+            Item(name=f"Dish {n}", category="Meals", selling_price=100 + n, description="Long text") for n in range(7)
+        )
+        self.ids = list(Item.objects.order_by("id").values_list("id", flat=True))
+
+    def test_cursor_continues_until_the_last_page(self):
+        url, seen, params = reverse("category_dishes", args=["Meals"]), [], {"limit": 3}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row["id"] for row in response.data)
+            if "X-Next-Cursor" not in response:
+                break
+            params["cursor"] = response["X-Next-Cursor"]
+        self.assertEqual(seen, self.ids)
+
+    def test_every_paginated_endpoint_uses_the_header(self):
+        for url in (reverse("shop"), reverse("product-details", args=[self.ids[0]])):
+            response = self.client.get(url, {"limit": 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("next_cursor", response.data)
+            self.assertTrue(response["X-Next-Cursor"])
+        last_page = self.client.get(reverse("shop"), {"cursor": self.ids[-2]})
+        self.assertEqual([row["id"] for row in last_page.data["all_dishes"]], self.ids[-1:])
+        self.assertNotIn("X-Next-Cursor", last_page)
+
+    def test_limit_and_cursor_are_validated(self):
+        url = reverse("category_dishes", args=["Meals"])
+        for params in ({"limit": 0}, {"limit": "ten"}, {"cursor": "abc"}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params)), response.data)
+        with mock.patch("api.pagination.MAX_PAGE_SIZE", 4):
+            self.assertEqual(len(self.client.get(url, {"limit": 1000}).data), 4)
+
+    def test_fields_projection_defers_the_other_columns(self):
+        url = reverse("category_dishes", args=["Meals"])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"fields": "name,selling_price"})
+        self.assertEqual(set(response.data[0]), {"id", "name", "selling_price"})
+        sql = next(query["sql"] for query in queries if 'FROM "api_item"' in query["sql"])
+        self.assertIn('"api_item"."selling_price"', sql)
+        self.assertNotIn('"api_item"."description"', sql)
+        self.assertEqual(self.client.get(url, {"fields": "name,secret"}).status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot filters against realistic volumes; a full table scan fails."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("customer@example.com", "9000000001")
+        Item.objects.bulk_create(
+            Item(name=f"Dish {n}", category=f"Category {n % 40}", selling_price=100, available=n % 7 != 0)
+            for n in range(4000)
+        )
+        cls.dish = Item.objects.first()
+        statuses = ["Pending", "Shipped", "Delivered", "Canceled"]
+        Order.objects.bulk_create(
+            Order(user=cls.user, status=statuses[n % 4], total_price=100, unique_id=encode(n, 6))
+            for n in range(4000)
+        )
+        CartItem.objects.bulk_create(
+            CartItem(user=cls.user, dish_id=dish_id, quantity=1, total_price=100)
+            for dish_id in Item.objects.values_list("id", flat=True)[:500]
+        )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Small test tables are cheaper to scan; make the planner show its index choice
+                cursor.execute("SET enable_seqscan = off")
+            else:
+                cursor.execute("ANALYZE")
+
+    def assertIndexed(self, queryset):
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        if connection.vendor == "postgresql":
+            self.assertNotIn(f"Seq Scan on {table}", plan, plan)
+        else:
+            full_scans = [line for line in plan.splitlines() if line.rstrip().endswith(f"SCAN {table}")]
+            self.assertFalse(full_scans, plan)
+            self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan, plan)
+
+    def test_category_pages(self):
+        self.assertIndexed(Item.objects.filter(category="Category 3").order_by("id")[:51])
+        self.assertIndexed(Item.objects.filter(category="Category 3", id__gt=100).order_by("id")[:51])
+        self.assertIndexed(Item.objects.filter(category="Category 3", available=True).order_by("id")[:51])
+
+    def test_orders_by_status_and_recency(self):
+        self.assertIndexed(Order.objects.filter(status="Pending"))
+        self.assertIndexed(Order.objects.filter(status="Pending").order_by("-order_at")[:20])
+        self.assertIndexed(Order.objects.order_by("-order_at")[:5])
+        self.assertIndexed(Order.objects.filter(user=self.user).order_by("-order_at"))
+
+    def test_cart_lookup(self):
+        self.assertIndexed(CartItem.objects.filter(user=self.user, dish=self.dish))
+
+    def test_cart_rows_are_unique_per_dish(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.bulk_create([CartItem(user=self.user, dish=self.dish, quantity=1)])
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, name="dish.jpg"):
+        buffer = io.BytesIO()
+        exif = PILImage.Exif()
+        exif[0x010F] = "Phone maker"
+        PILImage.new("RGB", (800, 600), (200, 80, 40)).save(buffer, format="JPEG", exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def test_upload_is_stripped_resized_and_deduplicated(self):
+        first = Item.objects.create(name="Dish", image=self.upload())
+        second = Item.objects.create(name="Same photo", image=self.upload("copy.jpg"))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith("items/"))
+        self.assertIsNone(ItemSerializer(first).data["image_srcset"])
+
+        # Variants are rendered by the worker, not the request
+        self.assertEqual(Worker(threads=1).run_once(), 2)
+        first.refresh_from_db()
+
+        with first.image.open() as stored:
+            self.assertNotIn(0x010F, PILImage.open(stored).getexif())
+        # No upscaled "detail" variant for an 800px photo
+        self.assertEqual(sorted(first.image_variants), ["card", "thumb"])
+        self.assertEqual(first.image_variants["thumb"]["width"], 160)
+
+        srcset = ItemSerializer(first).data["image_srcset"]
+        self.assertIn("160w", srcset["webp"])
+        self.assertIn(".jpeg 480w", srcset["jpeg"])
+
+    def test_reuploading_a_photo_keeps_or_rebuilds_its_variants(self):
+        item = Item.objects.create(name="Dish", image=self.upload())
+        Worker(threads=1).run_once()
+        item.refresh_from_db()
+        variants = item.image_variants
+
+        # Same photo again: nothing to render, the variants stay
+        item.image = self.upload("again.jpg")
+        item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.image_variants, variants)
+        self.assertEqual(Worker(threads=1).run_once(), 0)
+
+        # Swapping back to an earlier photo renders it again
+        other = io.BytesIO()
+        PILImage.new("RGB", (300, 300), (10, 10, 10)).save(other, format="PNG")
+        item.image = SimpleUploadedFile("other.png", other.getvalue(), content_type="image/png")
+        item.save()
+        Worker(threads=1).run_once()
+        item.image = self.upload("back.jpg")
+        item.save()
+        self.assertEqual(Worker(threads=1).run_once(), 1)
+        item.refresh_from_db()
+        self.assertEqual(item.image_variants, variants)
+
+
+flaky_calls = []
+
+
+@task("test_flaky_job", max_attempts=2)
+def flaky_job(value):
+    flaky_calls.append(value)
+    if len(flaky_calls) == 1:
+        raise RuntimeError("first attempt fails")
+
+
+class JobQueueTests(TestCase):
+    def test_failed_job_is_retried_after_backoff(self):
+        flaky_calls.clear()
+        enqueue(flaky_job, idempotency_key="once", value=1)
+        enqueue(flaky_job, idempotency_key="once", value=1)
+        self.assertEqual(Job.objects.count(), 1)
+
+        worker = Worker(threads=1)
+        with self.assertLogs("api.queue", "WARNING"):
+            self.assertEqual(worker.run_once(), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn("first attempt fails", job.last_error)
+
+        Job.objects.update(run_at=job.created_at)
+        worker.run_once()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+        self.assertEqual(flaky_calls, [1, 1])
+
+    def test_status_change_queues_a_notification(self):
+        order = Order.objects.create(user=create_user("customer@example.com", "9000000001"))
+        order.update_status("Shipped")
+        self.assertEqual(
+            sorted(Job.objects.filter(name="order_status_email").values_list("idempotency_key", flat=True)),
+            [f"order-status:{order.pk}:Pending", f"order-status:{order.pk}:Shipped"],
+        )
+        Worker(threads=1).run_once()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn("shipped", mail.outbox[1].subject)
+
+    def test_prune_deletes_old_finished_jobs(self):
+        for key, status in [("done", Job.DONE), ("failed", Job.FAILED), ("queued", Job.QUEUED), ("recent", Job.DONE)]:
+            enqueue(flaky_job, idempotency_key=key, value=key)
+            Job.objects.filter(idempotency_key=key).update(status=status)
+        Job.objects.exclude(idempotency_key="recent").update(updated_at=timezone.now() - timedelta(days=10))
+
+        out = io.StringIO()
+        call_command("prune_jobs", days=7, failed_days=30, stdout=out)
+        self.assertIn("Deleted 1 jobs", out.getvalue())
+        self.assertEqual(sorted(Job.objects.values_list("idempotency_key", flat=True)), ["failed", "queued", "recent"])
+
+        call_command("prune_jobs", days=7, failed_days=7, stdout=out)
+        self.assertEqual(sorted(Job.objects.values_list("idempotency_key", flat=True)), ["queued", "recent"])
+
+
+class AsyncViewTests(TransactionTestCase):
+    # The async views read on separate connections, so the data must be committed
+    # "__all__" takes in the replica alias when one is configured
+    databases = "__all__"
+
+    def setUp(self):
+        invalidate_summary_cache()
+        customer = create_user("customer@example.com", "9000000001")
+        for i in range(8):
+            item = Item.objects.create(name=f"Dish {i}", category=f"Category {i % 3}", selling_price=10)
+            order = Order.objects.create(user=customer, total_price=10)
+            ItemPurchase.objects.create(user=customer, order=order, item=item, quantity=1)
+
+    def test_async_views_match_sync_views(self):
+        for sync_url, async_url in (
+            (reverse("shop") + "?limit=5", reverse("async-shop") + "?limit=5"),
+            (reverse("orders"), reverse("async-orders")),
+            (reverse("dashboard"), reverse("async-dashboard")),
+        ):
+            expected = self.client.get(sync_url)
+            response = async_to_sync(self.async_client.get)(async_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+            self.assertEqual(response.get("X-Next-Cursor"), expected.get("X-Next-Cursor"))
+
+    def test_async_views_are_timed_across_their_threads(self):
+        registry.clear()
+        response = async_to_sync(self.async_client.get)(reverse("async-orders"))
+        timings = dict(entry.strip().split(";dur=", 1) for entry in response["Server-Timing"].split(","))
+        # The queries run on sync_to_async worker threads, not the middleware's
+        queries = int(timings["db"].split('desc="')[1].split()[0])
+        self.assertGreater(queries, 0)
+        self.assertGreater(float(timings["serialize"]), 0)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="async/orders/"} 1', registry.render())
+
+
+
+
+class OrderEventTests(TestCase):
+    def setUp(self):
+        self.admin = create_user("admin@example.com", "9000000002")
+        self.admin.is_staff = True
+        self.admin.save()
+        self.customer = create_user("customer@example.com", "9000000001")
+        self.partner = create_user("partner@example.com", "9000000003")
+        self.partner.groups.add(Group.objects.get_or_create(name="delivary_partner")[0])
+
+    def token(self, user):
+        return Token.objects.create(user=user).key
+
+    def test_order_changes_reach_subscribers_after_commit(self):
+        def change_orders():
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.create(user=self.customer, total_price=100)
+            with self.captureOnCommitCallbacks(execute=True):
+                order.update_status("Shipped")
+
+        async def listen():
+            subscription = broker().subscribe()
+            try:
+                await sync_to_async(change_orders)()
+                return [await asyncio.wait_for(subscription.get(), 1) for _ in range(2)]
+            finally:
+                subscription.close()
+
+        created, shipped = async_to_sync(listen)()
+        self.assertEqual((created["type"], created["status"], created["previous_status"]), ("created", "Pending", None))
+        self.assertEqual((shipped["type"], shipped["status"], shipped["previous_status"]), ("updated", "Shipped", "Pending"))
+        self.assertEqual(shipped["unique_id"], created["unique_id"])
+
+    def test_stream_is_refused_under_wsgi(self):
+        # A WSGI server would buffer the endless stream and hold the worker forever
+        response = self.client.get(reverse("order-events"), {"token": self.token(self.admin)})
+        self.assertEqual(response.status_code, 501)
+
+    def test_stream_requires_admin_or_partner(self):
+        url = reverse("order-events")
+        self.assertEqual(async_to_sync(AsyncClient().get)(url).status_code, 401)
+        response = async_to_sync(AsyncClient().get)(url, {"token": self.token(self.customer)})
+        self.assertEqual(response.status_code, 403)
+
+    def test_stream_frames_events(self):
+        url = reverse("order-events")
+
+        async def first_frames(token, orders):
+            response = await AsyncClient().get(url, {"token": token})
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            frames = response.streaming_content
+            try:
+                retry = await anext(frames)
+                for order in orders:
+                    await sync_to_async(broker().publish)(order_event(order, None, "created"))
+                return retry, await asyncio.wait_for(anext(frames), 1)
+            finally:
+                await frames.aclose()
+
+        other = Order(pk=1, unique_id="AAAAA", status="Pending", total_price=10)
+        assigned = Order(pk=2, unique_id="BBBBB", status="Shipped", total_price=20, delivery_person=self.partner)
+        retry, frame = async_to_sync(first_frames)(self.token(self.admin), [other])
+        self.assertEqual(retry, b"retry: 3000\n\n")
+        self.assertTrue(frame.startswith(b"event: order\ndata: "))
+        self.assertEqual(json.loads(frame.split(b"data: ", 1)[1])["unique_id"], "AAAAA")
+
+        # Partners only hear about orders assigned to them
+        retry, frame = async_to_sync(first_frames)(self.token(self.partner), [other, assigned])
+        self.assertEqual(json.loads(frame.split(b"data: ", 1)[1])["unique_id"], "BBBBB")
+
+
+class DispatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.get_or_create(name="delivary_partner")[0]
+        self.couriers = [create_user(f"courier{n}@example.com", f"900000010{n}") for n in range(3)]
+        self.group.user_set.add(*self.couriers)
+        self.customer = create_user("customer@example.com", "9000000001")
+        self.admin = create_user("admin@example.com", "9000000002")
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def loads(self):
+        return dict(CourierLoad.objects.values_list("courier_id", "active_orders"))
+
+    def ship(self, courier):
+        order = Order.objects.create(user=self.customer, total_price=100)
+        order.delivery_person = courier
+        order.update_status("Shipped")
+        return order
+
+    def test_loads_follow_orders_through_shipping(self):
+        first, second, third = self.couriers
+        self.assertEqual(self.loads(), {first.pk: 0, second.pk: 0, third.pk: 0})
+        order = self.ship(first)
+        self.ship(first)
+        self.assertEqual(self.loads()[first.pk], 2)
+
+        order.delivery_person = second
+        order.save()
+        self.assertEqual((self.loads()[first.pk], self.loads()[second.pk]), (1, 1))
+        order.update_status("Delivered")
+        self.assertEqual(self.loads()[second.pk], 0)
+
+        self.ship(third).delete()
+        self.assertEqual(self.loads()[third.pk], 0)
+
+        self.group.user_set.remove(third)
+        self.assertNotIn(third.pk, self.loads())
+
+    def test_auto_assign_picks_the_least_loaded_active_courier(self):
+        first, second, third = self.couriers
+        self.ship(first)
+        self.ship(second)
+        third.is_active = False
+        third.save()
+        order = Order.objects.create(user=self.customer, total_price=100)
+
+        response = self.client.post(reverse("orders-assign", args=[order.unique_id]))
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.delivery_person_id), ("Shipped", first.pk))
+        self.assertEqual(self.loads()[first.pk], 2)
+        self.assertEqual(response.data["delivery_person"]["email"], first.email)
+
+        # Already shipped
+        self.assertEqual(self.client.post(reverse("orders-assign", args=[order.unique_id])).status_code, 400)
+
+    def test_roster_is_cached_by_group_name(self):
+        with self.assertNumQueries(2):
+            roster = courier_roster()
+        self.assertEqual([row["email"] for row in roster], [courier.email for courier in self.couriers])
+        with self.assertNumQueries(0):
+            courier_roster()
+
+        self.customer.save()
+        with self.assertNumQueries(0):
+            courier_roster()
+
+        self.couriers[0].name = "Renamed"
+        self.couriers[0].save()
+        self.assertEqual(courier_roster()[0]["name"], "Renamed")
+
+        self.group.user_set.remove(self.couriers[1])
+        self.assertEqual(len(courier_roster()), 2)
+
+    def test_manual_assignment_requires_a_courier(self):
+        order = Order.objects.create(user=self.customer, total_price=100)
+        response = self.client.patch(
+            reverse("orders-unique_id", args=[order.unique_id]),
+            {"status": "Shipped", "delivery_partner_email": self.customer.email},
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            reverse("orders-unique_id", args=[order.unique_id]),
+            {"status": "Shipped", "delivery_partner_email": self.couriers[2].email},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.loads()[self.couriers[2].pk], 1)
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        invalidate_summary_cache()
+        self.courier = create_user("courier@example.com", "9000000003")
+        self.courier.groups.add(Group.objects.get_or_create(name="delivary_partner")[0])
+        self.customer = create_user("customer@example.com", "9000000001")
+        self.admin = create_user("admin@example.com", "9000000002")
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def transition(self, orders, target, **extra):
+        # Runs the summary cache invalidation queued for commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+            reverse("orders-transitions"),
+                {"unique_ids": [order.unique_id for order in orders], "status": target, **extra},
+                format="json",
+            )
+
+    def test_bulk_ship_and_deliver(self):
+        orders = [Order.objects.create(user=self.customer, total_price=100) for _ in range(20)]
+        self.transition(orders[:1], "Shipped", delivery_partner_email=self.courier.email)
+        with CaptureQueriesContext(connection) as few:
+            self.transition(orders[1:3], "Shipped", delivery_partner_email=self.courier.email)
+        # The number of queries doesn't grow with the batch
+        with self.assertNumQueries(len(few)):
+            response = self.transition(orders, "Shipped", delivery_partner_email=self.courier.email)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["orders"]), 17)
+        self.assertEqual(response.data["status_counts"], {"Shipped": 20})
+        self.assertEqual(self.courier.load.active_orders, 20)
+        self.assertEqual(Job.objects.filter(idempotency_key__endswith=":Shipped").count(), 20)
+        shipped_at = Order.objects.get(pk=orders[0].pk).shipping_time
+        self.assertIsNotNone(shipped_at)
+
+        response = self.transition(orders[:5], "Delivered")
+        self.assertEqual([row["status"] for row in response.data["orders"]], ["Delivered"] * 5)
+        self.assertEqual(order_summary()["status_counts"], {"Shipped": 15, "Delivered": 5})
+        delivered = Order.objects.get(pk=orders[0].pk)
+        self.assertEqual(delivered.shipping_time, shipped_at)
+        self.assertIsNotNone(delivered.delivery_time)
+        self.courier.load.refresh_from_db()
+        self.assertEqual(self.courier.load.active_orders, 15)
+
+    def test_retried_shipping_keeps_the_assigned_courier(self):
+        other = create_user("courier2@example.com", "9000000004")
+        other.groups.add(Group.objects.get(name="delivary_partner"))
+        order = Order.objects.create(user=self.customer, total_price=100)
+        self.transition([order], "Shipped", delivery_partner_email=self.courier.email)
+        response = self.transition([order], "Shipped", delivery_partner_email=other.email)
+        self.assertEqual(response.data["orders"], [])
+        self.assertEqual(Order.objects.get(pk=order.pk).delivery_person, self.courier)
+
+    def test_only_changed_rows_are_returned(self):
+        pending = Order.objects.create(user=self.customer, total_price=100)
+        canceled = Order.objects.create(user=self.customer, total_price=50)
+        canceled.update_status("Canceled")
+        response = self.transition([pending, canceled], "Canceled")
+        self.assertEqual([row["unique_id"] for row in response.data["orders"]], [pending.unique_id])
+        self.assertEqual(self.transition([pending, canceled], "Canceled").data["orders"], [])
+
+    def test_forbidden_transitions_reject_the_batch(self):
+        pending = Order.objects.create(user=self.customer, total_price=100)
+        delivered = Order.objects.create(user=self.customer, total_price=50)
+        delivered.update_status("Delivered")
+        response = self.transition([pending, delivered], "Canceled")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data["orders"]), [delivered.unique_id])
+        self.assertEqual(Order.objects.get(pk=pending.pk).status, "Pending")
+
+        self.assertEqual(self.transition([pending], "Delivered").status_code, 400)
+        self.assertEqual(self.transition([pending], "Shipped").status_code, 400)
+        response = self.transition([pending], "Canceled", delivery_partner_email=self.courier.email)
+        self.assertIn("delivery_partner_email", response.data)
+        self.assertEqual(Order.objects.get(pk=pending.pk).status, "Pending")
+        response = self.client.post(reverse("orders-transitions"), {"unique_ids": ["ZZZZZ"], "status": "Canceled"}, format="json")
+        self.assertEqual(response.data["orders"], {"ZZZZZ": "Order not found."})
+
+    def test_customers_cancel_through_the_state_machine(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        pending = Order.objects.create(user=self.customer, total_price=100)
+        delivered = Order.objects.create(user=self.customer, total_price=50)
+        delivered.update_status("Delivered")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.patch(reverse("user-orders-update", args=[pending.pk])).status_code, 204)
+        self.assertEqual(Order.objects.get(pk=pending.pk).status, "Canceled")
+        self.assertEqual(client.patch(reverse("user-orders-update", args=[delivered.pk])).status_code, 400)
+        self.assertEqual(Order.objects.get(pk=delivered.pk).status, "Delivered")
+
+        other = Order.objects.create(user=self.admin, total_price=10)
+        self.assertEqual(client.patch(reverse("user-orders-update", args=[other.pk])).status_code, 404)
+
+    def test_patch_writes_once_and_follows_the_state_machine(self):
+        order = Order.objects.create(user=self.customer, total_price=100)
+        url = reverse("orders-unique_id", args=[order.unique_id])
+        self.assertEqual(self.client.patch(url, {"status": "Delivered"}).status_code, 400)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {"status": "Shipped", "delivery_partner_email": self.courier.email})
+        self.assertEqual(response.status_code, 200)
+        updates = [query for query in queries if query["sql"].startswith('UPDATE "api_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.client.patch(url, {"status": "Pending"}).status_code, 400)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.customer = create_user("customer@example.com", "9000000001")
+        self.admin = create_user("admin@example.com", "9000000002")
+        self.admin.is_staff = True
+        self.admin.save()
+        self.biryani = Item.objects.create(name="Biryani", category="Meals", selling_price=200)
+        self.thali = Item.objects.create(name="Thali", category="Meals", selling_price=150)
+        self.cake = Item.objects.create(name="Cake", category="Desserts", selling_price=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def place(self, when, *lines):
+        order = Order.objects.create(user=self.customer)
+        for item, quantity in lines:
+            ItemPurchase.objects.create(user=self.customer, order=order, item=item, quantity=quantity)
+        Order.objects.filter(pk=order.pk).update(order_at=when)
+        order.refresh_from_db()
+        return order
+
+    def rollups(self, granularity):
+        return sorted(
+            SalesRollup.objects.filter(granularity=granularity)
+            .values_list("bucket__hour", "item_name", "status", "quantity", "revenue")
+        )
+
+    def report(self, **params):
+        return self.client.get(reverse("sales-report"), {"start": "2026-01-01", "end": "2026-01-02", **params})
+
+    def test_hourly_rows_come_from_orders_and_days_from_hours(self):
+        self.place(datetime(2026, 1, 1, 10, 15, tzinfo=dt_timezone.utc), (self.biryani, 1), (self.cake, 2))
+        self.place(datetime(2026, 1, 1, 10, 45, tzinfo=dt_timezone.utc), (self.biryani, 2))
+        self.place(datetime(2026, 1, 1, 13, 0, tzinfo=dt_timezone.utc), (self.thali, 1))
+        call_command("rebuild_sales_rollups", "--since=2026-01-01", "--until=2026-01-02", stdout=io.StringIO())
+
+        self.assertEqual(self.rollups("hour"), [
+            (10, "Biryani", "Pending", 3, 600),
+            (10, "Cake", "Pending", 2, 200),
+            (13, "Thali", "Pending", 1, 150),
+        ])
+        self.assertEqual(self.rollups("day"), [
+            (0, "Biryani", "Pending", 3, 600),
+            (0, "Cake", "Pending", 2, 200),
+            (0, "Thali", "Pending", 1, 150),
+        ])
+        # Recomputing changes nothing
+        call_command("rebuild_sales_rollups", "--since=2026-01-01", "--until=2026-01-02", stdout=io.StringIO())
+        self.assertEqual(SalesRollup.objects.count(), 6)
+
+    def test_deploy_rebuild_fills_only_missing_days(self):
+        self.place(datetime(2026, 1, 1, 10, 0, tzinfo=dt_timezone.utc), (self.biryani, 1))
+        self.place(datetime(2026, 1, 2, 10, 0, tzinfo=dt_timezone.utc), (self.cake, 1))
+        call_command("rebuild_sales_rollups", "--since=2026-01-01", "--until=2026-01-01", stdout=io.StringIO())
+        SalesRollup.objects.filter(granularity="day").update(quantity=7)
+
+        out = io.StringIO()
+        call_command("rebuild_sales_rollups", "--since=2026-01-01", "--until=2026-01-02", "--missing", stdout=out)
+        self.assertIn("for 1 days", out.getvalue())
+        self.assertEqual(
+            sorted(SalesRollup.objects.filter(granularity="day").values_list("item_name", "quantity")),
+            [("Biryani", 7), ("Cake", 1)],
+        )
+
+    @override_settings(TASK_QUEUE_EAGER=True)
+    def test_status_changes_refresh_the_order_hour(self):
+        order = self.place(datetime(2026, 1, 1, 10, 15, tzinfo=dt_timezone.utc), (self.biryani, 1))
+        keep = self.place(datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc), (self.cake, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            order.update_status("Canceled")
+            keep.update_status("Shipped")
+        self.assertEqual(self.rollups("hour"), [
+            (10, "Biryani", "Canceled", 1, 200),
+            (12, "Cake", "Shipped", 1, 100),
+        ])
+        self.assertEqual(self.report().data["revenue"], 100)
+
+    def test_report_reads_only_rollups(self):
+        self.place(datetime(2026, 1, 1, 10, 0, tzinfo=dt_timezone.utc), (self.biryani, 1), (self.cake, 3))
+        self.place(datetime(2026, 1, 2, 9, 0, tzinfo=dt_timezone.utc), (self.thali, 2))
+        canceled = self.place(datetime(2026, 1, 2, 9, 30, tzinfo=dt_timezone.utc), (self.biryani, 5))
+        Order.objects.filter(pk=canceled.pk).update(status="Canceled")
+        call_command("rebuild_sales_rollups", "--since=2026-01-01", "--until=2026-01-02", stdout=io.StringIO())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.report(top=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if '"api_order"' in query["sql"] or '"api_itempurchase"' in query["sql"]])
+
+        report = response.data
+        self.assertEqual((report["revenue"], report["quantity"]), (800, 6))
+        self.assertEqual([row["revenue"] for row in report["series"]], [500, 300])
+        self.assertEqual([(row["category"], row["revenue"]) for row in report["categories"]], [("Meals", 500), ("Desserts", 300)])
+        # Ties are broken by item id
+        self.assertEqual([row["name"] for row in report["top_items"]], ["Thali", "Cake"])
+
+        canceled_only = self.report(status="Canceled").data
+        self.assertEqual((canceled_only["revenue"], canceled_only["top_items"][0]["name"]), (1000, "Biryani"))
+        hourly = self.report(granularity="hour").data
+        self.assertEqual(len(hourly["series"]), 2)
+
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.report().status_code, 403)
+
+
+class EndpointBaselineTests(TransactionTestCase):
+    """Query counts per endpoint must not exceed api/benchmarks/baseline.json."""
+
+    databases = "__all__"  # Catalog and report endpoints read from the replica when configured
+
+    def test_query_counts_match_the_baseline(self):
+        order_sequence.reset()  # Earlier tests' flushes emptied the sequence table under the allocator
+        baseline = load_baseline()
+        context = seed(**baseline["dataset"])
+        results = run(SCENARIOS, context, requests=3, warmup=1)
+        self.assertEqual(set(results), set(baseline["endpoints"]))
+        for name, row in results.items():
+            with self.subTest(endpoint=name):
+                self.assertLessEqual(row["queries"], baseline["endpoints"][name]["queries"])
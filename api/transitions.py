@@ -0,0 +1,97 @@
+"""
+Order status state machine and bulk transitions.
+
+Orders move Pending -> Shipped -> Delivered, and can be canceled until
+they are delivered. ``transition_orders`` moves any number of orders with
+one locking SELECT, one UPDATE and one re-read. The timestamps are
+stamped in SQL, and the status counters, courier loads, notification and
+rollup jobs and dashboard events are updated in bulk the way Order.save
+would update them for a single order.
+"""
+from django.db import transaction
+from django.db.models.functions import Coalesce, Now
+from rest_framework.exceptions import ValidationError
+
+TRANSITIONS = {
+    "Pending": {"Shipped", "Canceled"},
+    "Shipped": {"Delivered", "Canceled"},
+    "Delivered": set(),
+    "Canceled": set(),
+}
+
+# Timestamp stamped the first time an order reaches a status
+STATUS_TIMESTAMPS = {"Shipped": "shipping_time", "Delivered": "delivery_time"}
+
+MAX_BATCH = 100
+
+
+def can_transition(current, target):
+    # Orders saved before statuses were enforced may have none; treat them as pending
+    return target in TRANSITIONS.get(current or "Pending", set())
+
+
+def transition_orders(unique_ids, target, delivery_person=None):
+    """
+    Move the orders in ``unique_ids`` to ``target`` and return the orders
+    that changed, with their details prefetched.
+
+    Orders already at ``target`` are left alone, so a retried request is
+    harmless. Unknown ids or a transition the state machine forbids reject
+    the whole batch. Shipping needs ``delivery_person``, which is assigned
+    to every order being shipped; no other move takes one.
+    """
+    from .dispatch import record_courier_changes
+    from .events import publish_order_event
+    from .models import Order
+    from .summary import record_order_changes
+    from .tasks import queue_sales_rollups, queue_status_notifications
+
+    if target not in TRANSITIONS:
+        raise ValidationError({"status": f"Unknown status {target!r}."})
+    if target == "Shipped" and delivery_person is None:
+        raise ValidationError({"delivery_partner_email": "A delivery partner is required to ship orders."})
+    if target != "Shipped" and delivery_person is not None:
+        raise ValidationError({"delivery_partner_email": "A delivery partner can only be given when shipping."})
+
+    unique_ids = list(dict.fromkeys(unique_ids))
+    with transaction.atomic():
+        # Lock in primary-key order so overlapping batches cannot deadlock
+        previous = {
+            order.pk: order
+            for order in Order.objects.select_for_update()
+            .filter(unique_id__in=unique_ids)
+            .order_by("pk")
+            .only("unique_id", "status", "total_price", "delivery_person")
+        }
+        found = {order.unique_id for order in previous.values()}
+        errors = {unique_id: "Order not found." for unique_id in unique_ids if unique_id not in found}
+        for order in previous.values():
+            if order.status != target and not can_transition(order.status, target):
+                errors[order.unique_id] = f"Cannot move a {order.status} order to {target}."
+        if errors:
+            raise ValidationError({"orders": errors})
+
+        changing = [pk for pk, order in previous.items() if order.status != target]
+        if not changing:
+            return []
+
+        changes = {"status": target}
+        if target in STATUS_TIMESTAMPS:
+            field = STATUS_TIMESTAMPS[target]
+            changes[field] = Coalesce(field, Now())
+        if delivery_person is not None:
+            changes["delivery_person"] = delivery_person
+        Order.objects.filter(pk__in=changing).update(**changes)
+
+        orders = list(Order.detailed.filter(pk__in=changing).order_by("pk"))
+        record_order_changes(
+            (previous[order.pk].summary_state(), order.summary_state()) for order in orders
+        )
+        record_courier_changes(
+            (previous[order.pk].tracked_state(), order.tracked_state()) for order in orders
+        )
+        queue_status_notifications(orders)
+        queue_sales_rollups(orders)
+        for order in orders:
+            publish_order_event(order, previous[order.pk].status, "updated")
+    return orders
@@ -3,6 +3,7 @@ from django.urls import path,include
 from django.conf import settings
 from django.conf.urls.static import static  
 from .views import *
+from . import async_views
 urlpatterns = [
     path('',index,name="index"),
     path('register/', RegisterView.as_view(), name='register'),
@@ -11,8 +12,10 @@ urlpatterns = [
     path('add_new_add/', DishCreateView.as_view(), name='add_new_add'),
     path('dishes/', Dishes.as_view(), name='dishes'),
     path('orders/', OrdersView.as_view(), name='orders'),
+    path('orders/transitions/', OrderTransitionView.as_view(), name='orders-transitions'),
     path('order-detail/<str:unique_id>/', OrdersView.as_view(), name='orders-detail'),
     path('orders/<str:unique_id>/', OrdersView.as_view(), name='orders-unique_id'),
+    path('orders/<str:unique_id>/assign/', AssignCourierView.as_view(), name='orders-assign'),
     path('orders-status/<str:category>/', OrderStatusView.as_view(), name='orders-status'),
     path('dish-details/<str:id>', DishesDetails.as_view(), name='dish-details'),
     path('product-details/<str:id>', ProductDetails.as_view(), name='product-details'),
@@ -20,11 +23,20 @@ urlpatterns = [
     path('new_dishes/', NewDishes.as_view(), name='new_dishes'),
     path('new_orders/', NewOrders.as_view(), name='new_orders'),
     path('shop/', ShopView.as_view(), name='shop'),
+    path('search/', SearchView.as_view(), name='search'),
     path('cart/', CartView.as_view(), name='cart'),
     path('cart/<int:cart_item_id>/', CartView.as_view(), name='cart-item-delete'),
+    path('cart/batch/', CartBatchView.as_view(), name='cart-batch'),
     path('purchase-cart-items/', BulkPurchaseView.as_view(), name='purchase-cart-items'),
     path('user-orders/', UserOrdersView.as_view(), name='user-orders'),
     path('user-orders/<int:oredr_id>/', UserOrdersView.as_view(), name='user-orders-update'),
     path('payments/', PaymentView.as_view(), name='payments'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('analytics/sales/', SalesReportView.as_view(), name='sales-report'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/shop/', async_views.shop, name='async-shop'),
+    path('async/orders/', async_views.orders_overview, name='async-orders'),
+    path('async/dashboard/', async_views.dashboard, name='async-dashboard'),
+    # ASGI only; see api.async_views for deploying it next to the WSGI app
+    path('async/orders/events/', async_views.order_events, name='order-events'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,11 +1,29 @@
-from rest_framework import viewsets,status
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 import json
-from django.http import HttpResponse
+import logging
+from datetime import timedelta
+from django.http import HttpResponse, StreamingHttpResponse
 from .serializers import *
+from .analytics import day_start, sales_report
+from .cart import apply_cart_changes, cart_for
+from .catalog import catalog_conditional, get_menu
+from .dispatch import assign_courier, couriers
+from .groups import user_role
+from .metrics import registry
+from .search import search_items
+from .summary import order_summary
+from .transitions import transition_orders
+from .exports import filter_order_range, stream_orders_csv, stream_orders_ndjson
+from .pagination import cursor_headers, keyset_page, page_limit, requested_fields
+from .payloads import catalog_page, delivery_partners, latest_orders, new_arrivals, shop_categories, shop_payload
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PAGE_SIZE = 20
 
 
 # Create your views here.
@@ -16,7 +34,6 @@ def index(request):
 
 class RegisterView(APIView):
     def post(self, request, *args, **kwargs):
-        print(request.data, "request.data")
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
@@ -26,32 +43,28 @@ class RegisterView(APIView):
                 "message": "User registered successfully!",
                 "token": token.key,
             }, status=status.HTTP_201_CREATED)
-        print(serializer.errors, "serializer.errors")
+        logger.info("Registration rejected errors=%s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class LoginView(APIView):
     def post(self, request, *args, **kwargs):
-        print(request.data)
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data['user']
 
             # Generate or retrieve token for the authenticated user
-            token, created = Token.objects.get_or_create(user=user)
-            user_groups = user.groups.all()
-            groups = None
-            if user_groups.filter(name='user').exists():
-                groups = "user"
-            elif user.is_superuser:
-                groups = "admin"
+            try:
+                token = user.auth_token
+            except Token.DoesNotExist:
+                # A concurrent login may have just created it
+                token, _ = Token.objects.get_or_create(user=user)
             user_serializer = UserSerializer(user)
             data = user_serializer.data
             data["tokens"] = token.key
-            data["groups"] = groups
-            print(data, "data")
+            data["groups"] = user_role(user)
             return Response(data, status=status.HTTP_200_OK)
-        print(serializer.errors, "serializer.errors")
+        logger.info("Login rejected errors=%s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class UserInfoView(APIView):
@@ -59,7 +72,6 @@ class UserInfoView(APIView):
 
     def get(self, request, *args, **kwargs):
         user_serializer = UserSerializer(request.user)
-        print(user_serializer.data)
         return Response(user_serializer.data, status=status.HTTP_200_OK)
     
 
@@ -76,8 +88,7 @@ class DishCreateView(APIView):
             # Add image to the parsed data
             data['image'] = img
 
-            # Debugging logs
-            print(request.FILES.get('dishImage'), "img")
+            logger.debug("Dish image upload image=%s", img)
         except json.JSONDecodeError as e:
             return Response({'error': f'Invalid JSON format: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -87,29 +98,15 @@ class DishCreateView(APIView):
             serializer.save()
             return Response({ "message": "User registered successfully!",}, status=status.HTTP_201_CREATED)
         else:
-            print(serializer.errors,"serializer.errors")
+            logger.info("Dish rejected errors=%s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 class Dishes(APIView):
+    replica_reads = True  # Read-only: served from the replica (api.routers)
+    @catalog_conditional
     def get(self, request):
-        # Get all items
-        items = Item.objects.all()
-        
-        # Group items by category
-        grouped_data = {}
-        for category in items.values_list('category', flat=True).distinct():
-            if category:  # Ignore null categories
-                grouped_data[category] = {
-                    "items": ItemSerializer(items.filter(category=category), many=True).data,
-                    "count": items.filter(category=category).count()
-                }
-        
-        # Total category count
-        category_count = len(grouped_data.keys())
-        return Response({
-            "categories": grouped_data,
-            "category_count": category_count
-        },status=status.HTTP_200_OK)
+        # Served from the versioned menu cache; rebuilt in one query on change
+        return Response(get_menu(), status=status.HTTP_200_OK)
 
 
 from rest_framework.exceptions import NotFound
@@ -125,7 +122,6 @@ class DishesDetails(APIView):
     def put(self, request, id):
         
         try:
-            print('hii')
             item = Item.objects.get(id=id)
         except Item.DoesNotExist:
             raise NotFound(detail="Dish not found")
@@ -142,8 +138,7 @@ class DishesDetails(APIView):
             # Add image to the parsed data
             data['image'] = img
 
-            # Debugging logs
-            print(request.FILES.get('dishImage'), "img")
+            logger.debug("Dish image upload image=%s", img)
         except json.JSONDecodeError as e:
             return Response({'error': f'Invalid JSON format: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -153,7 +148,7 @@ class DishesDetails(APIView):
             serializer.save()
             return Response({ "message": "User registered successfully!",}, status=status.HTTP_200_OK)
         else:
-            print(serializer.errors,"serializer.errors")
+            logger.info("Dish rejected errors=%s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, id, format=None):
@@ -176,19 +171,44 @@ class DishesDetails(APIView):
         
 
 class ProductDetails(APIView):
+    @catalog_conditional
     def get(self, request,id):
+        fields = requested_fields(request, ItemSerializer.Meta.fields)
         item = Item.objects.get(id=id)
         category = item.category
-        related_category = Item.objects.filter(category= category).exclude(id=id)
+        related_category = ItemSerializer.project(Item.objects.filter(category= category).exclude(id=id), fields)
+        related_page, next_cursor = keyset_page(related_category, request)
         product_item = ItemSerializer(item)
-        related_items = ItemSerializer(related_category,many=True)
+        related_items = ItemSerializer(related_page,many=True,fields=fields)
         
 
-        return Response({"product_data":product_item.data,"related_items":related_items.data},status=status.HTTP_200_OK)
+        return Response({"product_data":product_item.data,"related_items":related_items.data},status=status.HTTP_200_OK,headers=cursor_headers(next_cursor))
     
 
 
+class SearchView(APIView):
+    replica_reads = True
+
+    @catalog_conditional
+    def get(self, request):
+        # ?q= (last word matches as a prefix), ?available=, ?min_price=, ?max_price=, ?limit=, ?fields=
+        params = SearchQuerySerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+        filters = dict(params.validated_data)
+        query = filters.pop('q')
+        fields = requested_fields(request, ItemSerializer.Meta.fields)
+        items = search_items(
+            ItemSerializer.project(Item.objects.all(), fields), query,
+            limit=page_limit(request, SEARCH_PAGE_SIZE), **filters
+        )
+        results = ItemSerializer(items, many=True, fields=fields).data
+        for row, item in zip(results, items):
+            row['rank'] = item.search_rank
+        return Response({"results": results, "count": len(results)}, status=status.HTTP_200_OK)
+
+
 class NewDishes(APIView):
+    @catalog_conditional
     def get(self,request):
         items = Item.objects.all().order_by('-id')[:8]
         serializer = ItemSerializer(items,many =True)
@@ -196,64 +216,49 @@ class NewDishes(APIView):
 
 class NewOrders(APIView):
     def get(self,request):
-        orders = Order.objects.all().order_by('-id')[:8]
+        orders = Order.objects.with_purchases().order_by('-id')[:8]
         serializer = OrderSerializer(orders,many =True)
         return Response(serializer.data,status=status.HTTP_200_OK)
         
     
 class CategoryDishesView(APIView):
+    @catalog_conditional
     def get(self,request,category):
-        items = Item.objects.filter(category=category)
-        serializer = ItemSerializer(items,many =True)
+        fields = requested_fields(request, ItemSerializer.Meta.fields)
+        items = ItemSerializer.project(Item.objects.filter(category=category), fields)
+        page, next_cursor = keyset_page(items, request)
+        serializer = ItemSerializer(page,many =True,fields=fields)
 
-        return Response(serializer.data,status=status.HTTP_200_OK)
+        return Response(serializer.data,status=status.HTTP_200_OK,headers=cursor_headers(next_cursor))
 
 
 class ShopView(APIView):
+    replica_reads = True
+    @catalog_conditional
     def get(self,request):
-        categories = Item.objects.values_list('category', flat=True).distinct()[:6]
-        categories = [category for category in categories if category]  # Remove None or blank categories
-
-        new_items = Item.objects.all().order_by('-id')[:6]
-        new_arrival = ItemSerializer(new_items,many =True)
+        fields = requested_fields(request, ItemSerializer.Meta.fields)
+        page, next_cursor = catalog_page(request, fields)
+        payload = shop_payload(shop_categories(), new_arrivals(fields), page, fields)
+        return Response(payload,status=status.HTTP_200_OK,headers=cursor_headers(next_cursor))
 
-        all_items = Item.objects.all()
-        all_dishes = ItemSerializer(all_items,many =True)
-        return Response({"categories":categories,"new_arrival":new_arrival.data,"all_dishes":all_dishes.data},status=status.HTTP_200_OK)
-
-from django.core.exceptions import ObjectDoesNotExist  
 from django.shortcuts import get_object_or_404
 
 class CartView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self,request):
-        cart = CartItem.objects.filter(user=request.user.id)
-        serializers = AddtoCartSerializer(cart,many=True)
+        serializers = AddtoCartSerializer(cart_for(request.user), many=True)
         return Response(serializers.data,status=status.HTTP_200_OK)
     
     def post(self, request):
-        data = request.data
-        dish_id = data.get('dish')
-        quantity = int(data.get('quantity', 1))  # Ensure quantity is an integer
-
-        try:
-            # Attempt to retrieve the CartItem instance
-            item = CartItem.objects.get(user=request.user, dish=dish_id)
-            # Update the existing cart item
-            item.quantity = quantity
-            item.total_price = item.dish.selling_price * quantity
-            item.save()
-            serializer = AddtoCartSerializer(item)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        except CartItem.DoesNotExist:
-            # If the item does not exist, create a new cart item
-            data['user'] = request.user.id  # Add user ID to the data
-            serializer = AddtoCartSerializer(data=data)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        line = CartLineSerializer(data={'dish': request.data.get('dish'), 'quantity': request.data.get('quantity', 1)})
+        line.is_valid(raise_exception=True)
+        # Upsert on (user, dish), so repeated taps update the one row
+        apply_cart_changes(request.user, [line.validated_data])
+        item = cart_for(request.user).filter(dish=line.validated_data['dish']).first()
+        if item is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = AddtoCartSerializer(item)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
     def delete(self, request, cart_item_id):
@@ -272,6 +277,17 @@ class CartView(APIView):
                 status=status.HTTP_404_NOT_FOUND,
             )
         
+class CartBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # {"items": [{"dish": id, "quantity": n}, ...]}; returns the whole cart
+        serializer = CartBatchSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        cart = serializer.save()
+        return Response(AddtoCartSerializer(cart, many=True).data, status=status.HTTP_200_OK)
+
+
 class BulkPurchaseView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -286,7 +302,7 @@ class BulkPurchaseView(APIView):
             
             purchase_data = [
                 {
-                    "item": purchase.item.name,
+                    "item": purchase.item_name,
                     "quantity": purchase.quantity,
                     "total_price": purchase.total_price,
                 }
@@ -310,140 +326,157 @@ class UserOrdersView(APIView):
     permission_classes = [IsAuthenticated]  # Ensure only authenticated users can access this endpoint
 
     def get(self, request):
-        orders = Order.objects.filter(user=request.user).order_by('-created_at')
+        orders = Order.objects.with_purchases().filter(user=request.user).order_by('-order_at')
         serializer = OrderSerializer(orders, many=True)
         return Response(serializer.data)
     
     def patch(self, request, oredr_id):
 
         try:
-            # Retrieve the cart item belonging to the authenticated user
-            orders = Order.objects.get(id=oredr_id, user=request.user)
-            orders.status = 'Canceled'
-            orders.save()
-            return Response(
-                {"message": "Order item Canceled successfully."},
-                status=status.HTTP_204_NO_CONTENT,
-            )
-        except CartItem.DoesNotExist:
+            # Retrieve the order belonging to the authenticated user
+            order = Order.objects.only('unique_id').get(id=oredr_id, user=request.user)
+        except Order.DoesNotExist:
             return Response(
-                {"error": "Cart item not found or does not belong to the user."},
+                {"error": "Order not found or does not belong to the user."},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        # Same state machine as the admin endpoints: delivered orders stay delivered
+        transition_orders([order.unique_id], 'Canceled')
+        logger.info("Order canceled by customer order=%s", order.unique_id)
+        return Response(
+            {"message": "Order item Canceled successfully."},
+            status=status.HTTP_204_NO_CONTENT,
+        )
         
-from django.db.models import Count
-from django.utils.timezone import now
 class OrdersView(APIView):
     def get(self, request):
         # Count orders by status
-        status_counts = (
-            Order.objects.values('status')
-            .annotate(count=Count('status'))
-            .order_by('status')
-        )
-        status_counts_dict = {item['status']: item['count'] for item in status_counts}
-
-        # Get the last 8 orders
-        last_8_orders = Order.objects.all().order_by('-order_at')[:8]
-        last_8_orders_data = OrderSerializer(last_8_orders, many=True).data
-        # delivery_partner_group = Group.objects.get(name="delivery_partner")
-
-        # Get all users who belong to the 'delivery_partner' group
-        delivery_partners = CustomUser.objects.filter(groups=3)  # 3 is  delivery_partner group
-        delivary_user = UserSerializer(delivery_partners,many=True)
-  
- 
+        status_counts_dict = order_summary()['status_counts']
+
         # Combine the response
         response_data = {
             "status_counts": status_counts_dict,
-            "last_8_orders": last_8_orders_data,
-            "delivary_user": delivary_user.data,
+            "last_8_orders": latest_orders(8),
+            "delivary_user": delivery_partners(),
         }
 
         return Response(response_data, status=status.HTTP_200_OK)
     
     def post(self,request,unique_id):
-        order = Order.objects.get(unique_id=unique_id)
+        order = Order.detailed.get(unique_id=unique_id)
         serializers = AdminOrderSerializer(order)
         return Response(serializers.data, status=status.HTTP_200_OK)
 
     def patch(self,request,unique_id):
-        order = Order.objects.get(unique_id=unique_id)
-       
-        if request.data['status'] == "Shipped":
-            delivery_person = CustomUser.objects.get(email = request.data['delivery_partner_email'])
-            print(request.data['delivery_partner_email'],"request.data['delivery_partner_id']")
-            print(delivery_person)
-            order.delivery_person = delivery_person
-            order.status = request.data['status']
-            
-            order.update_status('Shipped')
-            order.save()
-
-        elif request.data['status'] == "Delivered":
-            order.status = request.data['status']
-            order.update_status('Delivered')
-            order.save()
-        else:
-            print(request.data['status'],unique_id,"data")
-            
-            order.status = request.data['status']
-            order.save()
-
+        get_object_or_404(Order, unique_id=unique_id)
+        delivery_person = None
+        if request.data.get('status') == "Shipped":
+            # Only members of the delivery partner group can be assigned
+            delivery_person = couriers().filter(email=request.data.get('delivery_partner_email')).first()
+            if delivery_person is None:
+                return Response({"error": "Delivery partner not found."}, status=status.HTTP_400_BAD_REQUEST)
+        transition_orders([unique_id], request.data.get('status'), delivery_person)
+        logger.info("Order status changed order=%s status=%s", unique_id, request.data.get('status'))
 
          # Count orders by status
-        status_counts = (
-            Order.objects.values('status')
-            .annotate(count=Count('status'))
-            .order_by('status')
-        )
-        status_counts_dict = {item['status']: item['count'] for item in status_counts}
-
-        # Get the last 8 orders
-        last_8_orders = Order.objects.all().order_by('-order_at')[:8]
-        last_8_orders_data = OrderSerializer(last_8_orders, many=True).data
-        # delivery_partner_group = Group.objects.get(name="delivery_partner")
-
-        # Get all users who belong to the 'delivery_partner' group
-        delivery_partners = CustomUser.objects.filter(groups=3)  # 3 is  delivery_partner group
-        delivary_user = UserSerializer(delivery_partners,many=True)
-  
- 
+        status_counts_dict = order_summary()['status_counts']
+
         # Combine the response
         response_data = {
             "status_counts": status_counts_dict,
-            "last_8_orders": last_8_orders_data,
-            "delivary_user": delivary_user.data,
+            "last_8_orders": latest_orders(8),
+            "delivary_user": delivery_partners(),
         }
         return Response(response_data, status=status.HTTP_200_OK)
     
+
+class OrderTransitionView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        # {"unique_ids": [...], "status": "...", "delivery_partner_email": "..."}; returns the orders that changed
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        orders = serializer.save()
+        return Response({
+            "orders": AdminOrderSerializer(orders, many=True).data,
+            "status_counts": order_summary()['status_counts'],
+        }, status=status.HTTP_200_OK)
+
+
+class AssignCourierView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, unique_id):
+        # Ship the order with whichever delivery partner has the fewest active orders
+        order = get_object_or_404(Order, unique_id=unique_id)
+        order = assign_courier(order.pk)
+        return Response(AdminOrderSerializer(Order.detailed.get(pk=order.pk)).data, status=status.HTTP_200_OK)
+
+
 class OrderStatusView(APIView):
     def post(self,request,category):
         # print(request.data,"status")
         # status = request.data['category']
-        print(category)
-        order = Order.objects.filter(status=category)
+        logger.debug("Orders by status status=%s", category)
+        order = Order.objects.with_purchases().filter(status=category)
         serializers = OrderSerializer(order,many=True)
         return Response(serializers.data, status=status.HTTP_200_OK)
     
 
 class PaymentView(APIView):
+    replica_reads = True
     def get(self,request):
-        order = Order.objects.all()
-        serializers = AdminOrderSerializer(order,many=True)
-        return Response(serializers.data, status=status.HTTP_200_OK)
+        # ?from=/?to= filter on order_at; ?export=ndjson|csv streams everything that matches
+        orders = filter_order_range(Order.detailed.all(), request)
+
+        export = request.query_params.get('export')
+        if export == 'ndjson':
+            return StreamingHttpResponse(stream_orders_ndjson(orders.order_by('id')), content_type='application/x-ndjson')
+        if export == 'csv':
+            response = StreamingHttpResponse(stream_orders_csv(orders.order_by('id')), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="payments.csv"'
+            return response
+        if export:
+            return Response({'error': 'export must be "ndjson" or "csv".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        page, next_cursor = keyset_page(orders, request, descending=True)
+        serializers = AdminOrderSerializer(page,many=True)
+        return Response(serializers.data, status=status.HTTP_200_OK, headers=cursor_headers(next_cursor))
 
 
-from django.db.models import Sum
 class DashboardView(APIView):
+    replica_reads = True
     def get(self,request):
-        total_amount = Order.objects.aggregate(total=Sum('total_price'))['total'] or 0
-        last_6_orders = Order.objects.all().order_by('-order_at')[:6]
-        last_6_orders_data = OrderSerializer(last_6_orders, many=True).data
-        
         response_data = {
-            "total_amount": total_amount,
-            "last_6_orders_data":last_6_orders_data
-            
+            "total_amount": order_summary()['total_revenue'],
+            "last_6_orders_data": latest_orders(6),
         }
-        return Response(response_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(response_data, status=status.HTTP_200_OK)
+
+
+class SalesReportView(APIView):
+    permission_classes = [IsAdminUser]
+    replica_reads = True
+
+    def get(self, request):
+        # ?start=&end= (dates, inclusive), ?granularity=hour|day, ?status= (repeatable), ?top=
+        params = SalesReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        report = sales_report(
+            day_start(query['start']),
+            day_start(query['end'] + timedelta(days=1)),
+            granularity=query['granularity'],
+            statuses=query.get('status'),
+            top=query['top'],
+        )
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        # Per-route latency/query histograms from api.metrics, for Prometheus to scrape
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
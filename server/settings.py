@@ -23,7 +23,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
 ALLOWED_HOSTS = [
     '*',
@@ -51,15 +51,18 @@ INSTALLED_APPS = [
 
 ]
 CORS_ALLOWED_ORIGINS = ['http://localhost:5173']  #ADD IN THE  REACT PORT
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'ETag']  # Keyset cursor; catalog revalidation
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'api.metrics.PerformanceMiddleware',  # Server-Timing and per-route histograms
      'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -97,16 +100,96 @@ WSGI_APPLICATION = 'server.wsgi.application'
 
 #On Server
 
-DATABASES = {
+# Persistent connections: reuse each worker's connection for DB_CONN_MAX_AGE
+# seconds, checking it is still alive before the first query of a request.
+# DB_POOL=True uses psycopg 3's connection pool instead (CONN_MAX_AGE must be 0;
+# requirements.txt installs psycopg with its pool extra).
+DB_CONNECTION = {
+    'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+    'CONN_HEALTH_CHECKS': True,
+}
+if config('DB_POOL', default=False, cast=bool):
+    DB_CONNECTION = {
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }},
+    }
+
+DATABASE_MODE = config('DATABASE_MODE', default='postgres')
+
+if DATABASE_MODE == 'local':
+    # Two SQLite files stand in for primary and replica; refresh the replica
+    # with `python manage.py sync_replica`.
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME'),
+            'USER' : config('DB_USER'),
+            'HOST' : config('DB_HOST'),
+            'PASSWORD' : config('DB_PASSWORD'),
+            'PORT' : config('DB_PORT'),
+            **DB_CONNECTION,
+        }
+    }
+    if config('DB_REPLICA_HOST', default=''):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': config('DB_REPLICA_HOST'),
+            'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Views with replica_reads = True read from this alias (see api.routers)
+DATABASE_REPLICA = 'replica' if 'replica' in DATABASES else None
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+# Seconds a client reads from the primary after writing, to cover replica lag
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# Cache
+# Catalog versions and ETags, group memberships, replica pinning, the search
+# index version and the courier roster are all invalidated through this cache,
+# so every worker must share one backend in production (e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache). With the
+# per-process LocMemCache a change only reaches the worker that made it.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME'),
-        'USER' : config('DB_USER'),
-        'HOST' : config('DB_HOST'),
-        'PASSWORD' : config('DB_PASSWORD'),
-        'PORT' : config('DB_PORT'),
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='server-cache'),
     }
 }
+if not DEBUG and CACHES['default']['BACKEND'].endswith('.LocMemCache'):
+    from django.core.exceptions import ImproperlyConfigured
+
+    raise ImproperlyConfigured(
+        'CACHE_BACKEND must be a cache shared by every worker (e.g. Redis or Memcached) '
+        'when DEBUG is off; LocMemCache only invalidates the process that made the change.'
+    )
+
+# Cache-Control for catalog responses (api.catalog.catalog_conditional). Browsers
+# revalidate after max-age with the ETag; the CDN may keep serving a copy for
+# s-maxage and refresh it in the background.
+CATALOG_CACHE_CONTROL = {
+    'public': True,
+    'max_age': config('CATALOG_MAX_AGE', default=30, cast=int),
+    's_maxage': config('CATALOG_CDN_MAX_AGE', default=300, cast=int),
+    'stale_while_revalidate': 60,
+}
 
 AUTH_USER_MODEL = 'api.CustomUser'
 # Password validation
@@ -128,6 +211,36 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# "default" is Django's stock PBKDF2 cost. "tuned" hashes new passwords with
+# PASSWORD_HASHER_ITERATIONS rounds; existing hashes keep verifying and are
+# rewritten at the tuned cost on the user's next login.
+# Compare profiles with `python manage.py bench_login`.
+
+PASSWORD_HASHER_ITERATIONS = config('PASSWORD_HASHER_ITERATIONS', default=600000, cast=int)
+
+PASSWORD_HASHER_PROFILES = {
+    'default': [
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+    'tuned': [
+        'api.hashers.TunedPBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+}
+
+PASSWORD_HASHER_PROFILE = config('PASSWORD_HASHER_PROFILE', default='default')
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -162,14 +275,64 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     
 
 }
 
+# Background jobs (api.queue), run by `python manage.py runworker`.
+# TASK_QUEUE_EAGER=True runs them right after the request's transaction
+# commits instead, for local development without a worker.
+TASK_QUEUE_EAGER = config('TASK_QUEUE_EAGER', default=False, cast=bool)
+
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+
+# Token -> user lookups cached by api.authentication.CachedTokenAuthentication
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': config('TOKEN_AUTH_CACHE_SIZE', default=1024, cast=int),
+    # Other workers may accept a revoked token for up to LOCAL_TTL seconds
+    'LOCAL_TTL': config('TOKEN_AUTH_CACHE_LOCAL_TTL', default=5, cast=int),
+    'TTL': config('TOKEN_AUTH_CACHE_TTL', default=300, cast=int),
+    'USE_DJANGO_CACHE': config('TOKEN_AUTH_SHARED_CACHE', default=False, cast=bool),
+}
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     # 'api.backends.EmailOrMobileAuthBackend',
-]
\ No newline at end of file
+]
+
+# Order change events for dashboards (api.events): 'memory' for one process,
+# 'postgres' to fan out across workers with LISTEN/NOTIFY
+ORDER_EVENTS_BACKEND = config('ORDER_EVENTS_BACKEND', default='memory')
+
+# Requests slower than this are logged as warnings by api.metrics.PerformanceMiddleware
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=1000, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': 'time=%(asctime)s level=%(levelname)s logger=%(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': config('LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
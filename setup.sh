@@ -5,7 +5,19 @@ pip install -r requirements.txt
 
 # Run migrations to set up the database
 python manage.py makemigrations
+# Existing duplicate cart rows would block the unique (user, dish) constraint
+python manage.py dedupe_cart_items
 python manage.py migrate
+# Copy item snapshots onto order lines saved before they carried one
+python manage.py backfill_purchase_snapshots
+# The status counters are kept by deltas from here on; seed them from the orders
+python manage.py rebuild_order_summary
+# Couriers only get a load row when their group changes; create one for each
+python manage.py rebuild_courier_loads
+# Item rating aggregates only count reviews saved after they were added
+python manage.py rebuild_item_ratings
+# Roll up the sales of days no rollup job has covered yet (all history on the first deploy)
+python manage.py rebuild_sales_rollups --missing
 
 # Collect static files (optional, remove if not using static files)
 # python manage.py collectstatic --noinput